@@ -3,11 +3,21 @@ This module contains the Experiment class for performing experiments with the mo
 """
 import itertools
 import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from os import listdir
 from os.path import isfile, join
 
 from model.model_code import *
 from model.community_setup import *
+from model.precompute import precompute_trajectories
+from model.result_archive import ResultArchive
+from model.result_aggregator import *
+from model.work_queue import WorkQueue
+
+# Lever-invariant trajectories shared with the replications of a worker process
+worker_trajectories = None
 
 
 class Experiment:
@@ -15,13 +25,34 @@ class Experiment:
     This class contains features and methods for performing experiments and data collection for results.
     """
 
-    def __init__(self, uncertainty_values=None, policy_levers=None, agent_list=None, community=None):
+    def __init__(self, uncertainty_values=None, policy_levers=None, agent_list=None, community=None,
+                 engine=EngineType.AGENT, batch_replications=False, seed=None, common_random_numbers=False):
 
         print('setting up the experiments...\n')
         self.start_time = time.time()
         self.all_results = None
+        self.archive = None
+        self.aggregator = None
+        self.stopping_rule = None
+        self.cache = None
+        self.replication_counts = {}
+        self.failed_runs = []
         self.community = community
         self.agent_list = agent_list
+        self.engine = engine
+        # The array engine reuses the lever-invariant trajectories of the community in every simulation run
+        self.trajectories = None
+        if engine is EngineType.ARRAY and agent_list is not None:
+            self.trajectories = precompute_trajectories(agent_list)
+        # Batched replications of a condition are simulated together by one model with a replication axis
+        if batch_replications and engine is not EngineType.ARRAY:
+            raise ValueError('Batched replications require the array engine')
+        self.batch_replications = batch_replications
+        # Every replication gets its own random stream, derived from the root seed of the experiment. With common random
+        # numbers, a replication uses the same stream in every experiment condition.
+        self.seed = seed
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.common_random_numbers = common_random_numbers
 
         # Set up uncertainties
         if uncertainty_values is None:
@@ -63,25 +94,328 @@ class Experiment:
         experiment_setup = pd.DataFrame(data=rows, columns=columns)
         return experiment_setup
 
-    def run_experiments(self, number_of_replications=10, steps=365, number_of_segments=1, segment_index=0):
-        """This function performs the experiment with all the parameters configured in the experiment set_up"""
+    def run_experiments(self, number_of_replications=10, steps=365, number_of_segments=1, segment_index=0,
+                        number_of_workers=1, result_folder=None, archive_folder=None, aggregate=False,
+                        stopping_rule=None, cache=None):
+        """
+        This function performs the experiment with all the parameters configured in the experiment set_up. Results of
+        an experiment condition are saved as soon as all its replications are completed.
+        :param number_of_replications: int: number of simulation runs per experiment condition
+        :param steps: int: number of steps per simulation run
+        :param number_of_segments: int: number of segments for distributed computation
+        :param segment_index: int: which segment to execute, starting from 0
+        :param number_of_workers: int: number of worker processes, the experiment runs in this process if 1
+        :param result_folder: string: folder the replications stream their results to during the run. Results of a
+        condition are then kept on disk instead of in memory, and all_results holds the directory of every condition.
+        :param archive_folder: string: folder of a result archive the replications are written to, partitioned by
+        community, condition and replication, instead of a csv file per condition
+        :param aggregate: Boolean: whether the key metrics of every condition are aggregated over its replications while
+        the experiment runs. The annual summary of all conditions is saved instead of the raw daily results, which are
+        only kept in the archive or result folder if one is given, and all_results holds the daily statistics of every
+        condition.
+        :param stopping_rule: ConfidenceIntervalRule: rule for adaptive replications. Replications are added to a
+        condition until the rule is satisfied, instead of running number_of_replications, and the replications are
+        aggregated. The number of replications of every condition is reported in replication_counts.
+        :param cache: ResultCache: cache of simulation results. Replications with cached results are loaded instead of
+        simulated, and simulated replications are added to the cache. Streamed replications, and replications of an
+        experiment without a seed, are always simulated.
+        """
         print('performing the experiments...\n')
 
         self.all_results = {}
+        self.failed_runs = []
+        self.replication_counts = {}
+        self.archive = None
+        self.aggregator = None
+        self.stopping_rule = stopping_rule
+        self.cache = cache
+        collector = CollectorType.DATACOLLECTOR
+        if archive_folder is not None:
+            self.archive = ResultArchive(archive_folder)
+            collector = CollectorType.RESULT_STORE
+        if aggregate or stopping_rule is not None:
+            self.aggregator = ResultAggregator(self.experiment_setup)
+            collector = CollectorType.RESULT_STORE
+        conditions = self.get_conditions(number_of_segments, segment_index)
+
+        if number_of_workers > 1:
+            self.run_in_parallel(conditions, number_of_replications, steps, number_of_workers,
+                                 result_folder=result_folder, collector=collector)
+        else:
+            for condition_index, (index, levers, uncertainties) in enumerate(conditions, start=1):
+                if condition_index % 5 == 0:
+                    print(f'Performing experiment condition {condition_index}/{len(conditions)}')
+                self.run_condition(index, levers, uncertainties, number_of_replications, steps, result_folder,
+                                   collector)
 
-        # For distributed computation, select conditions
-        segment_borders = self.get_segment_borders(number_of_segments, segment_index)
+        if self.stopping_rule is not None:
+            print(f'Replications per experiment condition: {dict(sorted(self.replication_counts.items()))}')
+        print('\n Experiment completed')
 
-        total_length = len(self.experiment_setup)
-        segment_length = math.floor(total_length / number_of_segments)
-        condition_index = 1
+    def run_condition(self, condition_index, levers, uncertainties, number_of_replications, steps,
+                      result_folder=None, collector=CollectorType.DATACOLLECTOR):
+        """
+        Runs all replications of an experiment condition in this process and saves its results.
+        :param condition_index: int: index of the experiment condition
+        :param levers: Dict: values of the policy levers
+        :param uncertainties: Dict: values of the uncertainties
+        :param number_of_replications: int: number of simulation runs of the condition without a stopping rule
+        :param steps: int: number of steps per simulation run
+        :param result_folder: string: folder the replications stream their results to, or None
+        :param collector: CollectorType: collector of the replications
+        """
+        results_for_a_condition = []
+        condition_directory = self.get_condition_directory(condition_index, result_folder)
+        completed = 0
+        round_size = self.get_round_size(condition_index, completed, number_of_replications)
+        while round_size > 0:
+            for first_replication, count in self.get_round_tasks(completed, round_size):
+                results = run_replication(trajectories=self.trajectories, time_tracking=True,
+                                          **self.get_replication_arguments(condition_index, levers, uncertainties,
+                                                                           first_replication, count, steps,
+                                                                           result_folder, collector))
+                for replication, replication_results in enumerate(results if count > 1 else [results],
+                                                                  start=first_replication):
+                    self.collect_replication(replication_results, condition_index, replication,
+                                             {**uncertainties, **levers})
+                    if condition_directory is None and self.aggregator is None:
+                        results_for_a_condition.append(replication_results)
+            completed += round_size
+            round_size = self.get_round_size(condition_index, completed, number_of_replications)
+
+        self.replication_counts[condition_index] = completed
+        results = pd.concat(results_for_a_condition) if results_for_a_condition else None
+        self.complete_condition(condition_index, results, condition_directory)
+
+    def run_queue(self, queue_folder, number_of_replications=10, steps=365, number_of_workers=1, result_folder=None,
+                  lease_time=3600, cache=None):
+        """
+        Runs the experiment as a worker of a work queue shared with workers in other processes or on other hosts.
+        Every worker claims the next experiment condition that is neither completed nor claimed, runs all its
+        replications and saves its results, and marks the condition as completed, so the workers balance the load
+        and a restarted experiment skips completed conditions. Conditions of a worker that crashed are taken over
+        once the lease of its claim expires. Results are saved in a csv file per condition, or streamed to the
+        result folder, since the archive and the annual summary of aggregated conditions are files of a single
+        process. Saved results are not kept in all_results, and failed_runs holds (index, None) for every condition
+        that failed in a worker.
+        :param queue_folder: string: folder of the queue on a filesystem shared by all workers
+        :param number_of_replications: int: number of simulation runs per experiment condition
+        :param steps: int: number of steps per simulation run
+        :param number_of_workers: int: number of worker processes started on this host, this process is the only
+        worker if 1
+        :param result_folder: string: folder the replications stream their results to, on the shared filesystem
+        :param lease_time: float: seconds after the last renewal of a claim before other workers may take it over
+        :param cache: ResultCache: cache of simulation results shared by the workers, as in run_experiments
+        """
+        print('performing the experiments...\n')
+
+        self.all_results = {}
+        self.failed_runs = []
+        self.replication_counts = {}
+        self.archive = None
+        self.aggregator = None
+        self.stopping_rule = None
+        self.cache = cache
+        conditions = {index: (levers, uncertainties) for index, levers, uncertainties in self.get_conditions()}
+        queue = WorkQueue(queue_folder, conditions.keys(), lease_time)
+
+        if number_of_workers > 1:
+            with ProcessPoolExecutor(max_workers=number_of_workers) as executor:
+                futures = [executor.submit(run_queue_worker, self, queue_folder, number_of_replications, steps,
+                                           result_folder, lease_time, cache) for _ in range(number_of_workers)]
+                for future in futures:
+                    self.failed_runs += future.result()
+        else:
+            # Conditions failed by this worker are left to other workers or a restart
+            failed_conditions = set()
+            while (index := queue.claim(failed_conditions)) is not None:
+                levers, uncertainties = conditions[index]
+                try:
+                    with queue.keep_claim(index):
+                        self.run_condition(index, levers, uncertainties, number_of_replications, steps,
+                                           result_folder)
+                except Exception as error:
+                    print(f'Experiment condition {index} failed: {error!r}')
+                    failed_conditions.add(index)
+                    queue.release(index)
+                    continue
+                queue.complete(index, {'replications': self.replication_counts[index]})
+                # Saved results are not kept by a worker
+                self.all_results.pop(index, None)
+                progress = queue.get_progress()
+                print(f'Completed experiment condition {index}, {progress["completed"]}/{len(conditions)} completed')
+            self.failed_runs = [(index, None) for index in sorted(failed_conditions)]
+
+        if self.failed_runs:
+            print(f'{len(self.failed_runs)} experiment conditions failed, rerun the queue to retry them')
+        print('\n Experiment completed')
+
+    def run_in_parallel(self, conditions, number_of_replications, steps, number_of_workers, max_attempts=2,
+                        result_folder=None, collector=CollectorType.DATACOLLECTOR):
+        """
+        Spreads the replications of all experiment conditions over a pool of worker processes. Replications of a
+        condition are combined in replication order once all of them are completed. Replications lost to a failing
+        or crashed worker are resubmitted to a new pool until max_attempts is reached. With batched replications, all
+        replications of a round of a condition are simulated by a single task. With a stopping rule, the next round of
+        a condition is submitted as soon as its previous round is completed.
+        :param conditions: list: index, levers and uncertainties of every experiment condition
+        :param number_of_replications: int: number of simulation runs per experiment condition
+        :param steps: int: number of steps per simulation run
+        :param number_of_workers: int: number of worker processes
+        :param max_attempts: int: number of times a replication is submitted before it is reported as failed
+        :param result_folder: string: folder the replications stream their results to, results are returned to this
+        process if None
+        :param collector: CollectorType: collector of the replications
+        """
+        parameters = {index: (levers, uncertainties) for index, levers, uncertainties in conditions}
+        # Results of every task of a condition by its first replication, None until the task is completed
+        tasks = {index: {} for index in parameters.keys()}
+        submitted = {}
+        pending = []
+        for index in parameters.keys():
+            submitted[index] = self.get_round_size(index, 0, number_of_replications)
+            for first_replication, count in self.get_round_tasks(0, submitted[index]):
+                tasks[index][first_replication] = None
+                pending.append((index, first_replication, count))
+
+        attempt = 0
+        while pending and attempt < max_attempts:
+            attempt += 1
+            failed = []
+            with ProcessPoolExecutor(max_workers=number_of_workers, initializer=set_worker_trajectories,
+                                     initargs=(self.trajectories,)) as executor:
+                futures = {}
+                for index, first_replication, count in pending:
+                    levers, uncertainties = parameters[index]
+                    future = executor.submit(run_replication, **self.get_replication_arguments(
+                        index, levers, uncertainties, first_replication, count, steps, result_folder, collector))
+                    futures[future] = (index, first_replication, count)
+
+                while futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index, first_replication, count = futures.pop(future)
+                        levers, uncertainties = parameters[index]
+                        try:
+                            results = future.result()
+                            results = results if count > 1 else [results]
+                            for replication, replication_results in enumerate(results, start=first_replication):
+                                self.collect_replication(replication_results, index, replication,
+                                                         {**uncertainties, **levers})
+                            if self.aggregator is not None:
+                                # Aggregated results are not kept
+                                results = []
+                            tasks[index][first_replication] = results
+                        except Exception as error:
+                            print(f'Replication {first_replication} of experiment condition {index} failed: {error!r}')
+                            failed.append((index, first_replication, count))
+                            continue
+
+                        if any(results is None for results in tasks[index].values()):
+                            continue
+                        round_size = self.get_round_size(index, submitted[index], number_of_replications)
+                        if round_size > 0:
+                            for next_replication, next_count in self.get_round_tasks(submitted[index], round_size):
+                                tasks[index][next_replication] = None
+                                try:
+                                    next_future = executor.submit(run_replication, **self.get_replication_arguments(
+                                        index, levers, uncertainties, next_replication, next_count, steps,
+                                        result_folder, collector))
+                                except BrokenProcessPool:
+                                    # A crashed worker broke the pool, the round is resubmitted to the next pool
+                                    failed.append((index, next_replication, next_count))
+                                    continue
+                                futures[next_future] = (index, next_replication, next_count)
+                            submitted[index] += round_size
+                            continue
+
+                        self.replication_counts[index] = submitted[index]
+                        results = None
+                        if result_folder is None and self.aggregator is None:
+                            results = pd.concat([replication_results for first in sorted(tasks[index].keys()) for
+                                                 replication_results in tasks[index][first]])
+                        self.complete_condition(index, results, self.get_condition_directory(index, result_folder))
+                        if len(self.all_results) % 5 == 0:
+                            print(f'Completed experiment condition {len(self.all_results)}/{len(conditions)}')
+            pending = sorted(failed)
+
+        self.failed_runs = [(index, first_replication) for index, first_replication, _ in pending]
+        if self.failed_runs:
+            print(f'{len(self.failed_runs)} replications failed, their experiment conditions were not saved')
+
+    def get_round_size(self, condition_index, completed, number_of_replications):
+        """
+        Returns the number of replications of the next round of an experiment condition. Without a stopping rule, all
+        replications form a single round. With a stopping rule, the first round has the minimum number of
+        replications, and every later round adds one replication, or the minimum number if replications are batched,
+        until the rule is satisfied.
+        :param condition_index: int: index of the experiment condition
+        :param completed: int: number of replications of the condition in earlier rounds
+        :param number_of_replications: int: number of simulation runs per experiment condition without a stopping rule
+        :return: int: number of replications of the next round, 0 once the condition is complete
+        """
+        if self.stopping_rule is None:
+            return number_of_replications - completed
+        if completed == 0:
+            return self.stopping_rule.min_replications
+        if self.stopping_rule.is_complete(self.aggregator.get_annual_totals(condition_index)):
+            return 0
+        round_size = self.stopping_rule.min_replications if self.batch_replications else 1
+        return min(round_size, self.stopping_rule.max_replications - completed)
+
+    def get_round_tasks(self, first_replication, round_size):
+        """
+        Returns the tasks of a round of replications. Batched replications of a round are a single task.
+        :param first_replication: int: index of the first replication of the round
+        :param round_size: int: number of replications of the round
+        :return: list: first replication and number of replications of every task
+        """
+        if self.batch_replications:
+            return [(first_replication, round_size)]
+        return [(replication, 1) for replication in range(first_replication, first_replication + round_size)]
+
+    def get_replication_arguments(self, condition_index, levers, uncertainties, first_replication, count, steps,
+                                  result_folder=None, collector=CollectorType.DATACOLLECTOR):
+        """
+        Returns the arguments of run_replication for a task of an experiment condition.
+        :param condition_index: int: index of the experiment condition
+        :param levers: Dict: values of the policy levers
+        :param uncertainties: Dict: values of the uncertainties
+        :param first_replication: int: index of the first replication of the task
+        :param count: int: number of replications of the task, simulated together if more than one
+        :param steps: int: number of steps per simulation run
+        :param result_folder: string: folder the replications stream their results to, or None
+        :param collector: CollectorType: collector of the replications
+        :return: Dict: keyword arguments of run_replication
+        """
+        replications = range(first_replication, first_replication + count)
+        seed_sequences = [self.get_seed_sequence(condition_index, replication) for replication in replications]
+        condition_directory = self.get_condition_directory(condition_index, result_folder)
+        result_directories = [get_replication_directory(condition_directory, replication) for replication in
+                              replications]
+        if condition_directory is None:
+            result_directories = None
+        elif count == 1:
+            result_directories = result_directories[0]
+        # Without a given seed the root seed is drawn from the OS, so the results could never be loaded again
+        cache = self.cache if self.seed is not None else None
+        return {'agent_list': self.agent_list, 'levers': levers, 'uncertainties': uncertainties, 'steps': steps,
+                'engine': self.engine, 'replications': count,
+                'seed_sequence': seed_sequences if count > 1 else seed_sequences[0],
+                'result_directory': result_directories, 'collector': collector, 'cache': cache}
+
+    def get_conditions(self, number_of_segments=1, segment_index=0):
+        """
+        Returns the experiment conditions of a segment for distributed computation.
+        :param number_of_segments: int: number of segments for distributed computation
+        :param segment_index: int: which segment to execute, starting from 0
+        :return: list: index, levers and uncertainties of every experiment condition in the segment
+        """
+        segment_borders = self.get_segment_borders(number_of_segments, segment_index)
+        conditions = []
 
         for index, row in self.experiment_setup.iterrows():
             if segment_borders[0] <= index <= segment_borders[1]:
-                if condition_index % 5 == 0:
-                    print(f'Performing experiment condition {condition_index}/{segment_length}')
-                condition_index += 1
-
                 uncertainties = {'X1': row.loc['X1'],
                                  'X2': row.loc['X2'],
                                  'X3': row.loc['X3'],
@@ -91,23 +425,75 @@ class Experiment:
                           'L2': row.loc['L1'],
                           'L3': row.loc['L1'],
                           }
+                conditions.append((index, levers, uncertainties))
 
-                results_for_a_condition = None
+        return conditions
 
-                for _ in range(number_of_replications):
-                    model = EnergyCommunity(levers=levers,
-                                            uncertainties=uncertainties,
-                                            agents_list=self.agent_list,
-                                            start_date=None)
-                    results = model.run_simulation(steps=steps, time_tracking=True)
+    def get_seed_sequence(self, condition_index, replication):
+        """
+        Returns the seed sequence of a replication. It only depends on the root seed, the experiment condition and the
+        replication, so reruns, segments and workers reproduce the same random streams.
+        :param condition_index: int: index of the experiment condition
+        :param replication: int: index of the replication
+        :return: SeedSequence: seed sequence of the replication
+        """
+        spawn_key = (replication,) if self.common_random_numbers else (condition_index, replication)
+        return np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=spawn_key)
 
-                    data_frames = [results_for_a_condition, results]
-                    results_for_a_condition = pd.concat(data_frames)
+    def collect_replication(self, results, condition_index, replication, parameters):
+        """
+        Passes the results of a replication to the result archive and the aggregator, if the experiment has them.
+        Streamed results are aggregated, but not archived.
+        :param results: DataFrame: results of the replication, or the directory they were streamed to
+        :param condition_index: int: index of the experiment condition
+        :param replication: int: index of the replication
+        :param parameters: Dict: values of the levers and uncertainties of the replication
+        """
+        if self.aggregator is not None:
+            self.aggregator.add_replication(condition_index, results, replication)
+        if not isinstance(results, str):
+            self.archive_replication(results, condition_index, replication, parameters)
 
-                self.all_results[index] = results_for_a_condition
+    def complete_condition(self, condition_index, results, condition_directory=None):
+        """
+        Stores the results of an experiment condition once all its replications are completed, and saves them unless
+        they were streamed.
+        :param condition_index: int: index of the experiment condition
+        :param results: DataFrame: results of all replications, None if they were streamed or aggregated
+        :param condition_directory: string: directory the replications streamed their results to, or None
+        """
+        if condition_directory is not None:
+            self.all_results[condition_index] = condition_directory
+        elif self.aggregator is not None:
+            self.all_results[condition_index] = self.aggregator.get_daily_statistics(condition_index)
+        else:
+            self.all_results[condition_index] = results
+        if condition_directory is None or self.aggregator is not None:
+            self.save_condition_results(condition_index)
 
-        self.save_results()
-        print('\n Experiment completed')
+    def archive_replication(self, results, condition_index, replication, parameters):
+        """
+        Writes the results of a replication to the result archive, if the experiment has one.
+        :param results: DataFrame: results of the replication with (metric, member) columns
+        :param condition_index: int: index of the experiment condition
+        :param replication: int: index of the replication
+        :param parameters: Dict: values of the levers and uncertainties of the replication
+        """
+        if self.archive is None:
+            return
+        self.archive.write_replication(results, self.community, condition_index, replication, parameters,
+                                       self.get_seed_sequence(condition_index, replication))
+
+    def get_condition_directory(self, condition_index, result_folder):
+        """
+        Returns the directory the replications of an experiment condition stream their results to.
+        :param condition_index: int: index of the experiment condition
+        :param result_folder: string: folder of the streamed results, or None if results are not streamed
+        :return: string: directory of the condition, None if results are not streamed
+        """
+        if result_folder is None:
+            return None
+        return os.path.join(result_folder, f'_{self.community}_results_{condition_index}')
 
     def get_segment_borders(self, number_of_segments, segment_index):
         """
@@ -117,9 +503,9 @@ class Experiment:
         :return: tuple: start and end index of the segment
         """
         total_length = len(self.experiment_setup)
-        segment_length = math.floor(total_length / number_of_segments)
-        start_index = segment_index * segment_length
-        end_index = start_index + (segment_length - 1)
+        # Remaining conditions are spread over the segments, so the segments cover all conditions
+        start_index = segment_index * total_length // number_of_segments
+        end_index = (segment_index + 1) * total_length // number_of_segments - 1
         borders = (start_index, end_index)
 
         return borders
@@ -128,9 +514,24 @@ class Experiment:
         """Save the results of the experiment in a csv file"""
         print('Saving results...\n')
 
-        for condition_index, results_df in self.all_results.items():
-            path = f'{folder}_{self.community}_results_{condition_index}.csv'
-            results_df.to_csv(path)
+        for condition_index in self.all_results.keys():
+            self.save_condition_results(condition_index, folder)
+
+    def save_condition_results(self, condition_index, folder='./output/'):
+        """
+        Save the results of an experiment condition in a csv file, or the manifest of the result archive and the
+        annual summary of the aggregated conditions
+        """
+        if self.archive is not None:
+            self.archive.save_manifest()
+        if self.aggregator is not None:
+            os.makedirs(folder, exist_ok=True)
+            self.aggregator.save_annual_summary(f'{folder}_{self.community}_annual_summary.csv')
+        if self.archive is not None or self.aggregator is not None:
+            return
+        os.makedirs(folder, exist_ok=True)
+        path = f'{folder}_{self.community}_results_{condition_index}.csv'
+        self.all_results[condition_index].to_csv(path)
 
     @staticmethod
     def load_results(folder='./output/', ec_name=None):
@@ -151,20 +552,107 @@ class Experiment:
             path = f'{folder}{condition_output}'
             df = pd.read_csv(path)
 
-            condition_idx = int(condition_output[22:-4])  # Takes only the number of the condition
-            # condition_idx = int(condition_output[25:-4])  # Takes only the number of the condition
+            condition_idx = int(re.search(r'_results_(\d+)\.csv$', condition_output).group(1))
             all_results[condition_idx] = df
 
         return all_results
 
 
+def set_worker_trajectories(trajectories):
+    """
+    Shares the lever-invariant trajectories of the community with all replications run by a worker process.
+    :param trajectories: CommunityTrajectories: precomputed trajectories or None
+    """
+    global worker_trajectories
+    worker_trajectories = trajectories
+
+
+def run_queue_worker(experiment, queue_folder, number_of_replications, steps, result_folder, lease_time, cache=None):
+    """
+    Runs an experiment as a worker process of a work queue.
+    :param experiment: Experiment: experiment of the worker
+    :param queue_folder: string: folder of the queue
+    :param number_of_replications: int: number of simulation runs per experiment condition
+    :param steps: int: number of steps per simulation run
+    :param result_folder: string: folder the replications stream their results to, or None
+    :param lease_time: float: seconds after the last renewal of a claim before other workers may take it over
+    :param cache: ResultCache: cache of simulation results, or None
+    :return: list: experiment conditions that failed in the worker
+    """
+    experiment.run_queue(queue_folder, number_of_replications, steps, result_folder=result_folder,
+                         lease_time=lease_time, cache=cache)
+    return experiment.failed_runs
+
+
+def get_replication_directory(condition_directory, replication):
+    """
+    Returns the directory a single replication streams its results to.
+    :param condition_directory: string: directory of the experiment condition, or None if results are not streamed
+    :param replication: int: index of the replication
+    :return: string: directory of the replication, None if results are not streamed
+    """
+    if condition_directory is None:
+        return None
+    return os.path.join(condition_directory, f'replication_{replication}')
+
+
+def run_replication(agent_list, levers, uncertainties, steps, engine=EngineType.AGENT, trajectories=None,
+                    time_tracking=False, replications=1, seed_sequence=None, result_directory=None,
+                    collector=CollectorType.DATACOLLECTOR, cache=None):
+    """
+    Simulates a single replication of an experiment condition.
+    :param agent_list: list: community configuration
+    :param levers: Dict: values of the policy levers
+    :param uncertainties: Dict: values of the uncertainties
+    :param steps: int: number of steps
+    :param engine: EngineType: engine used for advancing the model
+    :param trajectories: CommunityTrajectories: precomputed trajectories, defaults to those of the worker process
+    :param time_tracking: Boolean
+    :param replications: int: number of replications simulated together by a batched array engine
+    :param seed_sequence: SeedSequence: seed of the random stream, or a list with one per batched replication
+    :param result_directory: string: directory the results are streamed to during the run, if not None, or a list with
+    one directory per batched replication
+    :param collector: CollectorType: collector of the results, the result stream is used if results are streamed
+    :param cache: ResultCache: cache the results are loaded from if present, and added to otherwise
+    :return: DataFrame: results of the simulation run, or a list of DataFrames for batched replications. Streamed
+    results are returned as the directory they were written to.
+    """
+    if trajectories is None:
+        trajectories = worker_trajectories
+    if result_directory is not None:
+        collector = CollectorType.RESULT_STREAM
+    cache_key = None
+    if cache is not None and result_directory is None:
+        cache_key = cache.get_key(agent_list, levers, uncertainties, seed_sequence, steps, engine, collector,
+                                  replications)
+    if cache_key is not None:
+        results = cache.load(cache_key)
+        if results is not None:
+            return results
+    model = EnergyCommunity(levers=levers,
+                            uncertainties=uncertainties,
+                            agents_list=agent_list,
+                            start_date=None,
+                            engine=engine,
+                            trajectories=trajectories,
+                            replications=replications,
+                            seed_sequence=seed_sequence,
+                            collector=collector,
+                            result_directory=result_directory)
+    results = model.run_simulation(steps=steps, time_tracking=time_tracking)
+    if cache_key is not None:
+        cache.store(cache_key, results)
+    return results
+
+
 if __name__ == '__main__':
     start_time = time.time()
 
     community_name = 'gridflex_heeten'
     agents = create_community_configuration(community_name=community_name)
     experiment = Experiment(agent_list=agents, community=community_name)
-    experiment.run_experiments(number_of_replications=10, steps=365, number_of_segments=6, segment_index=5)
+    experiment.run_experiments(number_of_replications=10, steps=365, number_of_segments=6, segment_index=5,
+                               number_of_workers=os.cpu_count())
 
     run_time = round(time.time() - start_time, 2)
     print(f'Run time: {run_time} seconds')
@@ -3,83 +3,103 @@ This module contains all agent classes.
 """
 
 import datetime
-import random
 import math
 
 import numpy as np
 import pandas as pd
 
 pd.options.mode.chained_assignment = None  # default='warn'
-from mesa import Agent
 
 from model.enumerations import *
+from model.input_data import SLOTS_PER_DAY, get_input_data
+from model.community_balance import compute_energy_balance, get_tod_window
+from model.generation_cache import LINEAR, CUBED, get_generation_cache
 
-# random.seed(123)
+# Daily schedules of a member, held in this order in the member schedules of the model
+MEMBER_SCHEDULES = ['scheduled_demand', 'generation_schedule', 'realised_demand', 'excess_generation',
+                    'day_ahead_demand', 'day_ahead_supply']
 
-# Read the model input data
-df = pd.read_csv("../data/processed/model_input_data.csv", parse_dates=['Local'], infer_datetime_format=True,
-                 index_col=0)
-electricity_costs = pd.read_csv("../data/processed/electricity_costs.csv", index_col=1)
-electricity_costs = electricity_costs.to_dict(orient='index')
 
+class CommunityAgent:
+    """
+    Base class of all agents. Like the Mesa Agent, an agent has a unique id and the model it lives in, but agents keep
+    their attributes in __slots__ instead of an instance dictionary, so communities with thousands of members stay
+    small in memory.
+    """
+    __slots__ = ('unique_id', 'model')
 
-class Coordinator(Agent):
+    def __init__(self, unique_id, model):
+        self.unique_id = unique_id
+        self.model = model
+
+    def step(self):
+        pass
+
+
+class Coordinator(CommunityAgent):
     """This agent manages the energy community."""
+    __slots__ = ('agent_type', 'total_energy_export', 'total_energy_import', 'self_consumption', 'self_sufficiency',
+                 'is_prosumer', 'date')
 
     def __init__(self, unique_id, model):
         super().__init__(unique_id, model)
         self.agent_type = AgentType.COORDINATOR
         self.total_energy_export = None
         self.total_energy_import = None
+        self.self_consumption = None
+        self.self_sufficiency = None
+        self.is_prosumer = None  # Whether each member is a prosumer, in the order of the member schedules
         self.date = self.model.date
-        self.date_index = pd.date_range(start=self.date, periods=96, freq='15min')
 
     def step(self):
         self.update_date()
-        self.date_index = pd.date_range(start=self.date, periods=96, freq='15min')
+        if self.is_prosumer is None:
+            self.is_prosumer = np.array([member.agent_type is AgentType.PROSUMER for member in
+                                         self.model.schedule.buckets[Phase.MEMBERS]], dtype=bool)
         self.balance_supply_and_demand()
         if self.model.participation_in_tod is not None and self.model.participation_in_tod > 0:
             self.release_tod_schedule()
 
-    def balance_supply_and_demand(self):
+    @staticmethod
+    def step_bucket(coordinators):
+        """Runs the coordinator phase of a step, after all members have been stepped."""
+        for coordinator in coordinators:
+            coordinator.step()
+
+    def get_member_matrix(self, schedule, prosumers_only=False):
+        """
+        Returns a schedule of all members as a (members x slots) matrix. Members write their schedules into the member
+        schedules of the model, so the matrix is read without stacking.
+        :param schedule: string: name of the schedule attribute of the members
+        :param prosumers_only: Boolean: whether the schedules of consumers are taken as zero
+        :return: ndarray: schedules of all members in the order of the schedule
+        """
+        matrix = self.model.member_schedules[MEMBER_SCHEDULES.index(schedule)]
+        if prosumers_only:
+            matrix = np.where(self.is_prosumer[:, np.newaxis], matrix, 0)
+        return matrix
 
-        agg_supply = pd.Series(0, index=self.date_index)
-        agg_demand = pd.Series(0, index=self.date_index)
-        for agent in self.model.schedule.agents:
-            if agent.agent_type is AgentType.CONSUMER or agent.agent_type is AgentType.PROSUMER:
-                agg_demand += agent.realised_demand
-            if agent.agent_type is AgentType.PROSUMER:
-                agg_supply += agent.excess_generation
-        energy_export = (agg_supply - agg_demand).clip(lower=0)
-        energy_import = (agg_demand - agg_supply).clip(lower=0)
-        total_energy_export = energy_export.sum()
-        total_energy_import = energy_import.sum()
+    def balance_supply_and_demand(self):
+        """Computes the energy exchanged with the grid and the self-consumption and self-sufficiency of the day."""
+        energy_balance = compute_energy_balance(self.get_member_matrix('realised_demand'),
+                                                self.get_member_matrix('excess_generation', prosumers_only=True),
+                                                self.get_member_matrix('generation_schedule', prosumers_only=True))
+        self.total_energy_import, self.total_energy_export, self.self_consumption, self.self_sufficiency = [
+            float(value) for value in energy_balance]
 
     def release_tod_schedule(self):
-        tomorrow = (datetime.datetime.strptime(self.date, '%Y-%m-%d') + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
-        index = pd.date_range(start=tomorrow, periods=96, freq='15min')
-        empty_series = pd.Series(0, index=index)
-        day_ahead_demand = empty_series
-        day_ahead_supply = empty_series
-        # Get aggregated demand and supply for the next day
-        agents = [AgentType.CONSUMER, AgentType.PROSUMER]
-        for agent in self.model.schedule.agents:
-            if agent.agent_type in agents:
-                day_ahead_demand = day_ahead_demand + agent.day_ahead_demand
-                day_ahead_supply = day_ahead_supply + agent.day_ahead_supply
-        day_ahead_supply = self.adjust_generation_schedule(day_ahead_supply)
-        index = pd.date_range(start=tomorrow, periods=96, freq='H')
-        day_ahead_df = pd.DataFrame(index=index, data={'surplus': day_ahead_supply, 'deficit': day_ahead_demand})
-        supply_threshold = day_ahead_df['surplus'].quantile(0.7)
-        demand_threshold = day_ahead_df['deficit'].quantile(0.7)
-        self.model.tod_surplus_timing = day_ahead_df[day_ahead_df['surplus'] > supply_threshold].index.to_list()
-        self.model.tod_deficit_timing = day_ahead_df[day_ahead_df['deficit'] > demand_threshold].index.to_list()
+        """Releases the ToD windows for the next day based on the aggregated day-ahead schedules of all members."""
+        day_ahead_demand = self.get_member_matrix('day_ahead_demand').sum(axis=0)
+        day_ahead_supply = self.adjust_generation_schedule(self.get_member_matrix('day_ahead_supply').sum(axis=0))
+        self.model.tod_surplus_window = get_tod_window(day_ahead_supply)
+        self.model.tod_deficit_window = get_tod_window(day_ahead_demand)
+        self.model.tod_day = self.model.calendar.get_tomorrow_index(self.model.tick)
 
     def adjust_generation_schedule(self, day_ahead_supply):
-        if random.uniform(0, 1) < 5:
-            day_ahead_supply = day_ahead_supply * (1 + random.uniform(0.5, self.model.uncertainties['X3']))
+        if self.model.forecast_direction_draws[0] < 5:
+            day_ahead_supply = day_ahead_supply * (1 + self.model.forecast_error_draws[0])
         else:
-            day_ahead_supply = day_ahead_supply * (1 - random.uniform(0.5, self.model.uncertainties['X3']))
+            day_ahead_supply = day_ahead_supply * (1 - self.model.forecast_error_draws[0])
         return day_ahead_supply
 
     def update_date(self):
@@ -87,27 +107,37 @@ class Coordinator(Agent):
         return None
 
 
-class Member(Agent):
+class Member(CommunityAgent):
     """An agent with fixed initial wealth."""
+    __slots__ = ('member_name', 'agent_type', 'member_type', 'member_count', 'member_index', 'date', 'day', 'tomorrow',
+                 'load', 'demand_flexibility', 'assets', 'shifted_load', 'savings_ToD', 'energy_cost', 'earnings',
+                 'average_lcoe', *MEMBER_SCHEDULES)
 
-    def __init__(self, unique_id, model, member_name, agent_type, member_type, demand_flexibility, asset_list):
+    def __init__(self, unique_id, model, member_name, agent_type, member_type, demand_flexibility, asset_list,
+                 member_count=1):
         """ Initialize agent and variables.
         param unique_id: int: unique identifier for the agent
         :param model: model: model in which the agent lives
         :param member_name: string: name of the member
         :param member_type: MemberType: type of the member (consumer, prosumer, asset)
         :param asset_list: list: list of assets the member owns. Leave empty if the member has no assets.
+        :param member_count: int: number of identical households of a cohort agent, 1 for a single member
         """
         super().__init__(unique_id, model)
         self.member_name = member_name
         self.agent_type = agent_type
         self.member_type = member_type
+        # Schedules, shifted load and costs of a cohort are the totals of all its members
+        self.member_count = member_count
+        self.member_index = None  # Position of the member in the daily random variates of the model
         self.date = self.model.date
-        self.date_index = pd.date_range(start=self.date, periods=96, freq='15min')
+        self.day = None  # Day of the input data
+        self.tomorrow = None  # Day of the input data after the current day
         self.load = 0
         self.demand_flexibility = demand_flexibility
-        self.realised_demand = pd.Series(0, index=self.date_index)
-        self.excess_generation = pd.Series(0, index=self.date_index)
+        # Schedules are views of the member schedules of the model, attached once the member has its member_index
+        for schedule in MEMBER_SCHEDULES:
+            setattr(self, schedule, None)
         self.assets = []
         self.shifted_load = 0  # Load shifted by the member as complaince of ToD schedule
         self.savings_ToD = 0  # Savings in Euros by complying with demand response
@@ -117,10 +147,6 @@ class Member(Agent):
         else:
             self.assets = None
 
-        self.scheduled_demand = pd.Series(0, index=self.date_index)
-        self.generation_schedule = pd.Series(0, index=self.date_index)
-        self.day_ahead_demand = pd.Series(0, index=self.date_index)
-        self.day_ahead_supply = pd.Series(0, index=self.date_index)
         self.energy_cost = None
         self.earnings = None
         self.average_lcoe = self.compute_average_lcoe()
@@ -137,6 +163,20 @@ class Member(Agent):
         self.compute_earnings()
         pass
 
+    def attach_schedules(self, schedules):
+        """
+        Attaches the schedules of the member to its rows of the member schedules of the model.
+        :param schedules: ndarray: (schedules x slots) view in the order of MEMBER_SCHEDULES
+        """
+        for schedule, values in zip(MEMBER_SCHEDULES, schedules):
+            setattr(self, schedule, values)
+
+    @staticmethod
+    def step_bucket(members):
+        """Runs the member phase of a step, after all assets have been advanced."""
+        for member in members:
+            member.step()
+
     def initialise_asset(self, asset_list):
         item = None
         for asset in asset_list:
@@ -155,6 +195,8 @@ class Member(Agent):
 
     def update_date(self):
         self.date = self.model.date
+        self.day = self.model.calendar.get_day_index(self.model.tick)
+        self.tomorrow = self.model.calendar.get_tomorrow_index(self.model.tick)
         return None
 
     def get_generation_schedule(self):
@@ -162,88 +204,77 @@ class Member(Agent):
         This method returns the aggregated generation schedule of all the assets owned by the Prosumer. Returns a series
         of zeros if the member is not a Prosumer.
         """
-        index = pd.date_range(start=self.date, periods=96, freq='15min')
-        generation_schedule = pd.Series(index=index, data=0)
+        self.generation_schedule[:] = 0
         if self.agent_type is AgentType.PROSUMER:
             for asset in self.assets:
-                generation_schedule += asset.generate_supply_schedule()
+                self.generation_schedule += asset.generate_supply_schedule() * self.member_count
         else:
             pass
-        self.generation_schedule = generation_schedule
         return None
 
     def get_demand_schedule(self):
         """This method returns the demand schedule for the member_name."""
-        self.scheduled_demand = df.loc[self.date, self.member_name]
+        self.scheduled_demand[:] = get_input_data().get_schedule(self.day, self.member_name) * self.member_count
         return None
 
     def generate_day_ahead_schedules(self):
         """Generates day ahead demand and (excess) generation for an agent."""
-        tomorrow = (datetime.datetime.strptime(self.date, '%Y-%m-%d') + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
-        demand = df.loc[tomorrow, self.member_name]
-        index = pd.date_range(start=tomorrow, periods=96, freq='15min')
-        generation = pd.Series(index=index, data=0)
+        demand = get_input_data().get_schedule(self.tomorrow, self.member_name) * self.member_count
+        generation = np.zeros(SLOTS_PER_DAY)
         if self.agent_type is AgentType.PROSUMER:
             for asset in self.assets:
-                generation += asset.day_ahead_supply_schedule()
+                generation += asset.day_ahead_supply_schedule() * self.member_count
 
-        self.day_ahead_demand = (demand - generation).clip(lower=0)
-        self.day_ahead_supply = (generation - demand).clip(lower=0)
+        self.day_ahead_demand[:] = (demand - generation).clip(min=0)
+        self.day_ahead_supply[:] = (generation - demand).clip(min=0)
         return None
 
     def adjust_schedule_for_captive_consumption(self):
         """Modifies the demand schedule for an agent based on captive generation"""
         # Adjusting self consumption from the demand schedule and generation schedule
         if self.agent_type is AgentType.PROSUMER:
-            self.realised_demand = (self.scheduled_demand - self.generation_schedule).clip(lower=0)
+            self.realised_demand[:] = (self.scheduled_demand - self.generation_schedule).clip(min=0)
             # Updating the generation schedule based on captive consumption
-            self.excess_generation = (self.generation_schedule - self.scheduled_demand).clip(lower=0)
+            self.excess_generation[:] = (self.generation_schedule - self.scheduled_demand).clip(min=0)
         else:
-            self.realised_demand = self.scheduled_demand
+            self.realised_demand[:] = self.scheduled_demand
 
     def adjust_schedule_for_tod(self):
         # Update the demand schedule based on demand response
         increased_consumption = 0
         reduced_consumption = 0
-        if random.uniform(0, 1) <= self.model.participation_in_tod:
-            if self.model.tod_surplus_timing is not None:
-                if set(self.model.tod_surplus_timing) & set(self.realised_demand.index):
-                    updated_schedule = self.realised_demand[self.model.tod_surplus_timing] * (
-                            1 + self.demand_flexibility * random.uniform(self.model.demand_availability['minimum'],
-                                                                         self.model.demand_availability['maximum']))
-                    increased_consumption = updated_schedule.sum() - self.realised_demand[
-                        self.model.tod_surplus_timing].sum()
-                    increased_consumption = abs(increased_consumption)
-                    self.realised_demand.loc[self.model.tod_surplus_timing] = updated_schedule
-            if self.model.tod_deficit_timing is not None:
-                if set(self.model.tod_deficit_timing) & set(self.realised_demand.index):
-                    updated_schedule = self.realised_demand[self.model.tod_surplus_timing] * (
-                            1 - self.demand_flexibility * random.uniform(self.model.demand_availability['minimum'],
-                                                                         self.model.demand_availability['maximum']))
-                    reduced_consumption = self.realised_demand[
-                                              self.model.tod_surplus_timing].sum() - updated_schedule.sum()
-                    reduced_consumption = abs(reduced_consumption)
-                    self.realised_demand.loc[self.model.tod_surplus_timing] = updated_schedule
+        participants = self.model.participants[0, self.member_index]
+        if participants > 0:
+            # Only the participating members of a cohort shift their demand
+            participating_share = participants / self.member_count
+            windows_apply = self.model.tod_day == self.day
+            # Both adjustments act on the surplus window
+            window = self.model.tod_surplus_window
+            demand = self.realised_demand
+            if windows_apply and self.model.tod_surplus_window.any():
+                updated_schedule = demand * np.where(
+                    window, 1 + self.demand_flexibility * (self.model.surplus_draws[0, self.member_index] *
+                                                           participating_share), 1)
+                increased_consumption = abs(updated_schedule[window].sum() - demand[window].sum())
+                demand = updated_schedule
+            if windows_apply and self.model.tod_deficit_window.any():
+                updated_schedule = demand * np.where(
+                    window, 1 - self.demand_flexibility * (self.model.deficit_draws[0, self.member_index] *
+                                                           participating_share), 1)
+                reduced_consumption = abs(demand[window].sum() - updated_schedule[window].sum())
+                demand = updated_schedule
+            self.realised_demand[:] = demand
+            # Consumers report demand response in their scheduled demand as well
+            if self.agent_type is not AgentType.PROSUMER:
+                self.scheduled_demand[:] = demand
             self.shifted_load = max(increased_consumption, reduced_consumption)
 
     def compute_energy_cost(self):
         """Computes the energy cost for a member"""
-        month = datetime.datetime.strptime(self.date, '%Y-%m-%d').strftime('%B')
-        fixed_costs = electricity_costs[month]['Electricity Transport rate (Euro/day)'] + electricity_costs[month][
-            'Fixed delivery rate (Euro/day)']
-        variable_costs = electricity_costs[month]['Variable delivery rate (Euro/kWh)'] * self.realised_demand + \
-                         electricity_costs[month][
-                             'ODE tax (Environmental Taxes Act) (Euro/kWh)'] * self.realised_demand + \
-                         electricity_costs[month]['Energy tax (Euro/kWh)'] * self.realised_demand + \
-                         electricity_costs[month]['Variable delivery rate (Euro/kWh)'] * self.realised_demand
-        variable_costs = variable_costs.sum()
-        self.energy_cost = fixed_costs + variable_costs
-        self.savings_ToD = electricity_costs[month]['Variable delivery rate (Euro/kWh)'] * self.shifted_load + \
-                           electricity_costs[month][
-                               'ODE tax (Environmental Taxes Act) (Euro/kWh)'] * self.shifted_load + \
-                           electricity_costs[month]['Energy tax (Euro/kWh)'] * self.shifted_load + \
-                           electricity_costs[month]['Variable delivery rate (Euro/kWh)'] * self.shifted_load
-        self.energy_cost = self.energy_cost - self.savings_ToD
+        self.energy_cost, self.savings_ToD = self.model.tariff.compute_energy_cost(self.day,
+                                                                                   self.realised_demand,
+                                                                                   self.shifted_load,
+                                                                                   self.member_count)
 
     def compute_average_lcoe(self):
         """Computes the average LCOE for a member"""
@@ -265,13 +296,18 @@ class Member(Agent):
             pass
 
 
-class Asset(Agent):
+class Asset(CommunityAgent):
     """An asset of the energy community."""
+    __slots__ = ('date', 'day', 'tomorrow', 'agent_type', 'asset_type', 'owner', 'efficiency', 'capacity', 'asset_age',
+                 'estimated_lifetime_generation', 'supply_schedule', 'day_ahead_schedule', 'discount_rate', 'capex',
+                 'opex', 'lcoe')
 
     def __init__(self, unique_id, model, capacity, efficiency, owner, asset_age,
                  estimated_lifetime_generation, capex, opex, discount_rate=0.055):
         super().__init__(unique_id, model)
         self.date = self.model.date
+        self.day = None  # Day of the input data
+        self.tomorrow = None  # Day of the input data after the current day
         self.agent_type = AgentType.ASSET
         self.owner = owner
         self.efficiency = efficiency
@@ -290,16 +326,40 @@ class Asset(Agent):
     def step(self):
         super().step()
         self.date = self.model.date
+        self.day = self.model.calendar.get_day_index(self.model.tick)
+        self.tomorrow = self.model.calendar.get_tomorrow_index(self.model.tick)
         self.supply_schedule = self.generate_supply_schedule()
         self.day_ahead_schedule = self.day_ahead_supply_schedule()
         pass
 
+    @staticmethod
+    def step_bucket(assets):
+        """
+        Runs the asset phase of a step. All assets are moved to the day of the model at once. Their schedules are not
+        generated here, since the owners read them from the generation cache in the member phase.
+        """
+        model = assets[0].model
+        day = model.calendar.get_day_index(model.tick)
+        tomorrow = model.calendar.get_tomorrow_index(model.tick)
+        for asset in assets:
+            asset.date = model.date
+            asset.day = day
+            asset.tomorrow = tomorrow
+
     def generate_supply_schedule(self):
         pass
 
     def day_ahead_supply_schedule(self):
         pass
 
+    def get_supply_key(self):
+        """Returns the key of the generation profile of the asset in the generation cache"""
+        pass
+
+    def get_day_ahead_key(self):
+        """Returns the key of the day-ahead generation profile of the asset in the generation cache"""
+        pass
+
     def estimate_lifetime_generation(self):
         """Estimates lifetime generation/supply of the asset"""
         lifespan = 25 - self.asset_age
@@ -335,6 +395,7 @@ class Asset(Agent):
 
 class Solar(Asset):
     """A solar asset of the energy community."""
+    __slots__ = ()
 
     def __init__(self, unique_id, model, capacity=0, efficiency=0, owner=None, asset_age=0,
                  estimated_lifetime_generation=0, capex=0, opex=0, discount_rate=0.055):
@@ -345,19 +406,31 @@ class Solar(Asset):
     def generate_supply_schedule(self):
         """ Generates a schedule for the solar asset based on the capacity and efficiency of the solar panel"""
         super().generate_supply_schedule()
-        supply_schedule = self.capacity * self.efficiency * df.loc[self.date, 'Direct [W/m^2]'] / 1000000
+        supply_schedule = get_generation_cache().get_profile(self.get_supply_key())[self.day]
         return supply_schedule
 
     def day_ahead_supply_schedule(self):
         """ Generates a schedule for the solar asset based on the capacity and efficiency of the solar panel"""
         super().day_ahead_supply_schedule()
-        tomorrow = (datetime.datetime.strptime(self.date, '%Y-%m-%d') + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
-        supply_schedule = self.capacity * self.efficiency * df.loc[tomorrow, 'Direct [W/m^2]'] / 1000000
+        supply_schedule = get_generation_cache().get_profile(self.get_day_ahead_key())[self.tomorrow]
         return supply_schedule
 
+    def get_supply_key(self):
+        """Returns the key of the generation profile of the asset in the generation cache"""
+        return 'Direct [W/m^2]', LINEAR, self.generation_coefficient()
+
+    def get_day_ahead_key(self):
+        """Returns the key of the day-ahead generation profile of the asset in the generation cache"""
+        return 'Direct [W/m^2]', LINEAR, self.generation_coefficient()
+
+    def generation_coefficient(self):
+        """Returns the factor converting direct irradiance [W/m^2] into generation of the solar panel"""
+        return self.capacity * self.efficiency / 1000000
+
 
 class Wind(Asset):
     """A wind asset of the energy community."""
+    __slots__ = ('number_of_turbines', 'rotor_diameter', 'avg_air_density', 'swept_area')
 
     def __init__(self, unique_id, model, capacity=0, efficiency=0, owner=None, asset_age=1,
                  estimated_lifetime_generation=0, capex=0, opex=0, discount_rate=0.055, number_of_turbines=1,
@@ -374,26 +447,85 @@ class Wind(Asset):
     def generate_supply_schedule(self):
         """ Generates a schedule for the wind asset based on the capacity and efficiency of the wind turbine"""
         super().generate_supply_schedule()
-        wind_speed = df.loc[self.date, 'Wind [m/s]']
-        wind_speed[wind_speed > 30] = 0  # Wind turbine shuts down if wind speed is greater than 30 m/s
-        supply_schedule = 0.5 * self.avg_air_density * self.swept_area * np.power(wind_speed,
-                                                                                  3) * self.efficiency * self.number_of_turbines
+        supply_schedule = get_generation_cache().get_profile(self.get_supply_key())[self.day]
         return supply_schedule
 
     def day_ahead_supply_schedule(self):
         """ Generates a schedule for the wind asset based on the capacity and efficiency of the wind turbine"""
         super().day_ahead_supply_schedule()
-        tomorrow = (datetime.datetime.strptime(self.date, '%Y-%m-%d') + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
-        wind_speed = df.loc[tomorrow, 'Direct [W/m^2]']
-        wind_speed[wind_speed > 30] = 0
-        supply_schedule = 0.5 * self.avg_air_density * self.swept_area * np.power(wind_speed,
-                                                                                  3) * self.efficiency * self.number_of_turbines
+        supply_schedule = get_generation_cache().get_profile(self.get_day_ahead_key())[self.tomorrow]
         return supply_schedule
 
+    def get_supply_key(self):
+        """Returns the key of the generation profile of the asset in the generation cache"""
+        return 'Wind [m/s]', CUBED, self.generation_coefficient()
+
+    def get_day_ahead_key(self):
+        """Returns the key of the day-ahead generation profile of the asset in the generation cache"""
+        # Day-ahead wind forecasts are read from the irradiance column
+        return 'Direct [W/m^2]', CUBED, self.generation_coefficient()
+
+    def generation_coefficient(self):
+        """Returns the factor converting the cubed wind speed [m/s] into generation of the wind turbines"""
+        return 0.5 * self.avg_air_density * self.swept_area * self.efficiency * self.number_of_turbines
+
 
 class Battery(Asset):
+    __slots__ = ()
+
     def __init__(self, unique_id, model, capacity=0, efficiency=0, owner=None, asset_age=1,
                  estimated_lifetime_generation=0, capex=0, opex=0, discount_rate=0.055):
         self.asset_type = AssetType.BATTERY_STORAGE
         super(Battery, self).__init__(unique_id, model, capacity, efficiency, owner, asset_age,
                                       estimated_lifetime_generation, capex, opex, discount_rate)
+
+
+def scale_uniforms(uniforms, low, high):
+    """
+    Scales standard uniform random numbers to the range between two bounds.
+    :param uniforms: ndarray: random numbers in [0, 1)
+    :param low: float: first bound
+    :param high: float: second bound, may be below the first bound
+    :return: ndarray: random numbers between the bounds
+    """
+    return low + (high - low) * uniforms
+
+
+def draw_participants(uniforms, member_counts, participation):
+    """
+    Converts standard uniform random numbers into the number of participating members of every community member.
+    A single member participates when its random number is at most the participation rate. The participants of a
+    cohort are a binomial sample, drawn by inversion so that every cohort uses exactly one random number per day.
+    :param uniforms: ndarray: ([replications x] members) random numbers in [0, 1)
+    :param member_counts: ndarray: number of members of every community member
+    :param participation: float: probability that a member participates
+    :return: ndarray: number of participating members
+    """
+    participants = (uniforms <= participation).astype(int)
+    for index in np.flatnonzero(member_counts > 1):
+        # A cohort loses the members that do not participate, which reduces to the rule of a single member
+        participants[..., index] = member_counts[index] - get_binomial_quantiles(uniforms[..., index],
+                                                                                 member_counts[index],
+                                                                                 1 - participation)
+    return participants
+
+
+def get_binomial_quantiles(uniforms, trials, probability):
+    """
+    Returns quantiles of a binomial distribution, i.e. binomial samples for standard uniform random numbers.
+    :param uniforms: ndarray: random numbers in [0, 1)
+    :param trials: int: number of trials
+    :param probability: float: success probability of every trial
+    :return: ndarray: smallest number of successes with a cumulative probability of at least the random number
+    """
+    if probability <= 0:
+        return np.zeros(np.shape(uniforms), dtype=int)
+    if probability >= 1:
+        return np.full(np.shape(uniforms), trials, dtype=int)
+    # The probability mass function is built up in logs, since (1 - p) ** n underflows for large cohorts
+    successes = np.arange(trials)
+    log_ratios = np.log((trials - successes) / (successes + 1)) + math.log(probability / (1 - probability))
+    log_pmf = np.concatenate([[trials * math.log1p(-probability)], trials * math.log1p(-probability) +
+                              np.cumsum(log_ratios)])
+    cdf = np.cumsum(np.exp(log_pmf))
+    return np.minimum(np.searchsorted(cdf, uniforms), trials)
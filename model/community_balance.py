@@ -0,0 +1,55 @@
+"""
+This module contains the aggregation of member schedules into community outcomes and ToD windows.
+"""
+
+import numpy as np
+
+
+def compute_energy_balance(realised_demand, excess_generation, generation_schedule):
+    """
+    Aggregates the schedules of all members into the energy exchanged with the grid and the self-consumption and
+    self-sufficiency of the community.
+    :param realised_demand: ndarray: ([replications x] members x slots) demand after captive consumption
+    :param excess_generation: ndarray: (members x slots) generation left after captive consumption
+    :param generation_schedule: ndarray: (members x slots) generation of the assets of the members
+    :return:
+        energy_import: ndarray: electricity imported from the grid
+        energy_export: ndarray: electricity exported to the grid
+        self_consumption: ndarray: share of the generation consumed in the community, 0 without generation
+        self_sufficiency: ndarray: share of the consumption supplied by the community, 0 without consumption
+    """
+    demand = realised_demand.sum(axis=-2)
+    supply = excess_generation.sum(axis=-2)
+    energy_export = (supply - demand).clip(min=0).sum(axis=-1)
+    energy_import = (demand - supply).clip(min=0).sum(axis=-1)
+    total_generation = generation_schedule.sum(axis=(-2, -1))
+    # Consumption includes the captive consumption of prosumers, i.e. generation that never became excess
+    total_consumption = realised_demand.sum(axis=(-2, -1)) + total_generation - excess_generation.sum(axis=(-2, -1))
+    self_consumption = get_share(total_generation - energy_export, total_generation)
+    self_sufficiency = get_share(total_consumption - energy_import, total_consumption)
+    return energy_import, energy_export, self_consumption, self_sufficiency
+
+
+def get_share(part, total):
+    """
+    Divides a part by a total, returning 0 where the total is 0.
+    :param part: ndarray: part of the total
+    :param total: ndarray: total
+    :return: ndarray: share of the total
+    """
+    total = np.broadcast_to(total, np.shape(part))
+    return np.divide(part, total, out=np.zeros(np.shape(part)), where=total > 0)
+
+
+def get_tod_window(day_ahead_schedule):
+    """
+    Selects the slots of a day-ahead schedule above its 70th percentile. As in the hourly ToD schedule of the
+    coordinator, the schedule is evaluated on the first slot of every hour.
+    :param day_ahead_schedule: ndarray: aggregated day-ahead schedule, optionally one per replication
+    :return: ndarray: boolean mask of the ToD window
+    """
+    hourly_schedule = day_ahead_schedule[..., ::4]
+    threshold = np.quantile(hourly_schedule, 0.7, axis=-1, keepdims=True)
+    window = np.zeros(day_ahead_schedule.shape, dtype=bool)
+    window[..., ::4] = hourly_schedule > threshold
+    return window
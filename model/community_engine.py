@@ -0,0 +1,449 @@
+"""
+This module contains the array-backed engine for advancing an energy community.
+"""
+
+from model.agents import *
+
+
+class CommunityEngine:
+    """
+    Holds the state of all community members in contiguous (members x slots) matrices and advances the whole
+    community with one vectorized pass per day. The engine reproduces the behaviour of stepping the Member, Asset and
+    Coordinator agents one by one.
+    """
+
+    def __init__(self, model, trajectories=None):
+        """
+        Initialize the engine from the agents of a model.
+        :param model: EnergyCommunity: model whose agents are advanced by the engine
+        :param trajectories: CommunityTrajectories: precomputed lever-invariant trajectories of the community. If None,
+        schedules are computed from the input data every day.
+        """
+        self.model = model
+        self.members = list(model.schedule.buckets[Phase.MEMBERS])
+        self.coordinator = None
+        for agent in model.schedule.buckets[Phase.COORDINATOR]:
+            self.coordinator = agent
+        self.member_keys = [str(member.member_name) + str('_') + str(member.unique_id) for member in self.members]
+
+        # Positions of the member demand profiles and the weather columns in the input data
+        input_data = get_input_data()
+        self.member_columns = np.array([input_data.columns[member.member_name] for member in self.members], dtype=int)
+        self.direct_column = input_data.columns['Direct [W/m^2]']
+        self.wind_column = input_data.columns['Wind [m/s]']
+
+        self.is_prosumer = np.array([member.agent_type is AgentType.PROSUMER for member in self.members], dtype=bool)
+        # Schedules are computed per household and scaled to the totals of cohort agents
+        self.member_counts = np.array([member.member_count for member in self.members], dtype=int)
+        self.demand_flexibility = np.array([member.demand_flexibility for member in self.members], dtype=float)
+        self.average_lcoe = np.array([member.average_lcoe for member in self.members], dtype=float)
+
+        # Generation coefficients of the assets owned by prosumers and of every asset category
+        self.solar_coefficient = np.zeros(len(self.members))
+        self.wind_coefficient = np.zeros(len(self.members))
+        for index, member in enumerate(self.members):
+            if member.agent_type is AgentType.PROSUMER:
+                for asset in member.assets:
+                    solar, wind = get_generation_coefficients(asset)
+                    self.solar_coefficient[index] += solar
+                    self.wind_coefficient[index] += wind
+        self.category_coefficients = {}
+        for asset_category, assets in model.all_assets.items():
+            coefficients = np.array([np.multiply(get_generation_coefficients(asset), asset.owner.member_count)
+                                     for asset in assets]).sum(axis=0)
+            self.category_coefficients[asset_category] = coefficients
+
+        # Trajectory of every member when the lever-invariant schedules are precomputed
+        self.trajectories = trajectories
+        if self.trajectories is not None:
+            self.member_trajectories = self.trajectories.get_trajectory_indexes(self.get_member_profiles(),
+                                                                                self.category_coefficients)
+
+        shape = (len(self.members), SLOTS_PER_DAY)
+        self.scheduled_demand = np.zeros(shape)
+        self.generation_schedule = np.zeros(shape)
+        self.realised_demand = np.zeros(shape)
+        self.excess_generation = np.zeros(shape)
+        self.day_ahead_demand = np.zeros(shape)
+        self.day_ahead_supply = np.zeros(shape)
+        self.shifted_load = np.zeros(len(self.members))
+        self.savings_ToD = np.zeros(len(self.members))
+        self.energy_cost = np.zeros(len(self.members))
+        self.earnings = np.zeros(len(self.members))
+        self.asset_supply = {asset_category: 0 for asset_category in model.all_assets.keys()}
+        # Community outcomes of the day, computed when the community has a coordinator
+        self.energy_import = np.nan
+        self.energy_export = np.nan
+        self.self_consumption = np.nan
+        self.self_sufficiency = np.nan
+
+
+    def step(self):
+        """Advance all members, assets and the coordinator by one day."""
+        calendar = self.model.calendar
+        day = calendar.get_day_index(self.model.tick)
+        tomorrow = calendar.get_tomorrow_index(self.model.tick)
+        if self.trajectories is not None:
+            self.read_trajectories(day)
+        else:
+            self.get_schedules(self.read_day(day))
+            self.generate_day_ahead_schedules(self.read_day(tomorrow))
+            self.adjust_schedule_for_captive_consumption()
+        self.adjust_schedule_for_tod(day)
+        self.compute_energy_cost(day)
+        self.compute_earnings()
+
+        if self.coordinator is not None:
+            self.balance_supply_and_demand()
+        if self.coordinator is not None and self.model.participation_in_tod is not None and \
+                self.model.participation_in_tod > 0:
+            self.release_tod_schedule(tomorrow)
+
+    @staticmethod
+    def read_day(day):
+        """
+        Reads the input data of a day.
+        :param day: int: index of the day in the input data
+        :return: ndarray: read-only (slots x columns) view of the input data
+        """
+        return get_input_data().values[day]
+
+    def read_trajectories(self, day):
+        """Sets the lever-invariant schedules of all members from the precomputed trajectories of a day."""
+        trajectories = self.trajectories
+        counts = self.member_counts[:, np.newaxis]
+        self.scheduled_demand = trajectories.scheduled_demand[day][self.member_trajectories] * counts
+        self.generation_schedule = trajectories.generation_schedule[day][self.member_trajectories] * counts
+        self.realised_demand = trajectories.realised_demand[day][self.member_trajectories] * counts
+        self.excess_generation = trajectories.excess_generation[day][self.member_trajectories] * counts
+        self.day_ahead_demand = trajectories.day_ahead_demand[day][self.member_trajectories] * counts
+        self.day_ahead_supply = trajectories.day_ahead_supply[day][self.member_trajectories] * counts
+        for asset_category, supply in trajectories.asset_supply.items():
+            self.asset_supply[asset_category] = supply[day]
+
+    def get_schedules(self, day_data):
+        """Sets the demand and generation schedules of all members and the supply of all asset categories."""
+        direct, wind_speed = day_data[:, self.direct_column], day_data[:, self.wind_column]
+        counts = self.member_counts[:, np.newaxis]
+        self.scheduled_demand = day_data[:, self.member_columns].T * counts
+        self.generation_schedule = compute_generation(self.solar_coefficient, self.wind_coefficient, direct,
+                                                      wind_speed) * counts
+        self.asset_supply = compute_asset_supply(self.category_coefficients, direct, wind_speed)
+
+    def generate_day_ahead_schedules(self, day_data):
+        """Generates day ahead demand and (excess) generation for all members."""
+        # Day-ahead wind forecasts are read from the irradiance column, as in Wind.day_ahead_supply_schedule
+        direct = day_data[:, self.direct_column]
+        counts = self.member_counts[:, np.newaxis]
+        demand = day_data[:, self.member_columns].T * counts
+        generation = compute_generation(self.solar_coefficient, self.wind_coefficient, direct, direct) * counts
+        self.day_ahead_demand, self.day_ahead_supply = split_day_ahead_schedules(demand, generation)
+
+    def adjust_schedule_for_captive_consumption(self):
+        """Modifies the demand schedule of prosumers based on captive generation."""
+        self.realised_demand, self.excess_generation = split_captive_consumption(self.scheduled_demand,
+                                                                                 self.generation_schedule,
+                                                                                 self.is_prosumer)
+
+    def adjust_schedule_for_tod(self, day):
+        """Updates the demand schedule of all participating members based on demand response."""
+        surplus_available = self.model.tod_day == day and self.model.tod_surplus_window.any()
+        deficit_available = self.model.tod_day == day and self.model.tod_deficit_window.any()
+        participating, surplus_draws, deficit_draws = self.draw_tod_variates(surplus_available, deficit_available)
+
+        increased_consumption = np.zeros(len(self.members))
+        reduced_consumption = np.zeros(len(self.members))
+        # Both adjustments act on the surplus window, as in Member.adjust_schedule_for_tod
+        window = self.model.tod_surplus_window
+        if surplus_available:
+            window_demand = self.realised_demand[:, window]
+            updated_schedule = window_demand * (1 + self.demand_flexibility * surplus_draws)[:, np.newaxis]
+            increased_consumption = np.abs(updated_schedule.sum(axis=1) - window_demand.sum(axis=1))
+            self.realised_demand[:, window] = updated_schedule
+        if deficit_available:
+            window_demand = self.realised_demand[:, window]
+            updated_schedule = window_demand * (1 - self.demand_flexibility * deficit_draws)[:, np.newaxis]
+            reduced_consumption = np.abs(window_demand.sum(axis=1) - updated_schedule.sum(axis=1))
+            self.realised_demand[:, window] = updated_schedule
+        # Members that do not participate keep the shifted load of their last participation
+        self.shifted_load = np.where(participating, np.maximum(increased_consumption, reduced_consumption),
+                                     self.shifted_load)
+
+        # Consumers share one Series for scheduled and realised demand, so demand response shows up in both
+        consumer = ~self.is_prosumer
+        self.scheduled_demand[consumer] = self.realised_demand[consumer]
+
+    def draw_tod_variates(self, surplus_available, deficit_available):
+        """
+        Reads participation and demand availability of every member from the daily random variates of the model, the
+        same variates the Member agents use.
+        :param surplus_available: Boolean or ndarray: whether a surplus window applies today
+        :param deficit_available: Boolean or ndarray: whether a deficit window applies today
+        :return:
+            participating: ndarray: whether each member participates in demand response today
+            surplus_draws: ndarray: available share of flexible demand in the surplus window
+            deficit_draws: ndarray: available share of flexible demand in the deficit window
+        """
+        replications = self.get_replications()
+        participants = self.model.participants[replications]
+        participating = participants > 0
+        # Only the participating members of a cohort shift their demand
+        participating_share = participants / self.member_counts
+        surplus_draws = np.where(participating & surplus_available,
+                                 self.model.surplus_draws[replications] * participating_share, 0)
+        deficit_draws = np.where(participating & deficit_available,
+                                 self.model.deficit_draws[replications] * participating_share, 0)
+        return participating, surplus_draws, deficit_draws
+
+    @staticmethod
+    def get_replications():
+        """Returns the rows of the daily random variates used by the engine."""
+        return 0
+
+    def compute_energy_cost(self, day):
+        """Computes the energy cost and ToD savings of all members."""
+        self.energy_cost, self.savings_ToD = self.model.tariff.compute_energy_cost(day, self.realised_demand,
+                                                                                   self.shifted_load,
+                                                                                   self.member_counts)
+
+    def compute_earnings(self):
+        """Computes the earnings of all members."""
+        self.earnings = np.where(self.is_prosumer, self.excess_generation.sum(axis=1) * self.average_lcoe, 0)
+
+    def balance_supply_and_demand(self):
+        """Computes the energy exchanged with the grid and the self-consumption and self-sufficiency of the day."""
+        self.energy_import, self.energy_export, self.self_consumption, self.self_sufficiency = compute_energy_balance(
+            self.realised_demand, self.excess_generation, self.generation_schedule)
+
+    def release_tod_schedule(self, tomorrow):
+        """Releases the ToD windows for the next day based on the aggregated day-ahead schedules."""
+        day_ahead_demand = self.day_ahead_demand.sum(axis=0)
+        day_ahead_supply = self.coordinator.adjust_generation_schedule(self.day_ahead_supply.sum(axis=0))
+        self.model.tod_surplus_window = get_tod_window(day_ahead_supply)
+        self.model.tod_deficit_window = get_tod_window(day_ahead_demand)
+        self.model.tod_day = tomorrow
+
+    def get_member_profiles(self):
+        """
+        Returns the lever-invariant profile of every member: demand column, member type and generation coefficients.
+        :return: list: profile of every member
+        """
+        return list(zip(self.member_columns.tolist(), self.is_prosumer.tolist(), self.solar_coefficient.tolist(),
+                        self.wind_coefficient.tolist()))
+
+    def get_member_values(self, values):
+        """
+        Maps values of all members to their reporter keys.
+        :param values: ndarray: one value per member
+        :return: Dict: value per member
+        """
+        return dict(zip(self.member_keys, values.tolist()))
+
+
+class BatchedCommunityEngine(CommunityEngine):
+    """
+    Advances several replications of a community at once. Replications only differ in their random draws, so the
+    lever-invariant schedules are computed once per day, while demand response, costs and ToD windows of all
+    replications are held in (replications x members x slots) arrays and driven by vectorized random draws.
+    """
+
+    def __init__(self, model, replications, trajectories=None):
+        """
+        Initialize the engine from the agents of a model.
+        :param model: EnergyCommunity: model whose agents are advanced by the engine
+        :param replications: int: number of replications simulated together
+        :param trajectories: CommunityTrajectories: precomputed lever-invariant trajectories of the community
+        """
+        super().__init__(model, trajectories)
+        self.replications = replications
+        shape = (replications, len(self.members))
+        self.shifted_load = np.zeros(shape)
+        self.savings_ToD = np.zeros(shape)
+        self.energy_cost = np.zeros(shape)
+        # The model holds the ToD windows of every replication
+        self.model.tod_surplus_window = np.zeros((replications, SLOTS_PER_DAY), dtype=bool)
+        self.model.tod_deficit_window = np.zeros((replications, SLOTS_PER_DAY), dtype=bool)
+        self.energy_import = np.full(replications, np.nan)
+        self.energy_export = np.full(replications, np.nan)
+        self.self_consumption = np.full(replications, np.nan)
+        self.self_sufficiency = np.full(replications, np.nan)
+
+    def adjust_schedule_for_tod(self, day):
+        """Updates the demand schedule of all participating members in every replication based on demand response."""
+        window_applies = self.model.tod_day == day
+        surplus_available = (self.model.tod_surplus_window.any(axis=1) & window_applies)[:, np.newaxis]
+        deficit_available = (self.model.tod_deficit_window.any(axis=1) & window_applies)[:, np.newaxis]
+        participating, surplus_draws, deficit_draws = self.draw_tod_variates(surplus_available, deficit_available)
+
+        # Both adjustments act on the surplus window, as in Member.adjust_schedule_for_tod
+        window = self.model.tod_surplus_window[:, np.newaxis, :]
+        realised_demand = np.repeat(self.realised_demand[np.newaxis], self.replications, axis=0)
+        window_demand = np.where(window, realised_demand, 0).sum(axis=-1)
+        realised_demand = np.where(window, realised_demand * (1 + self.demand_flexibility * surplus_draws)[
+            ..., np.newaxis], realised_demand)
+        updated_demand = np.where(window, realised_demand, 0).sum(axis=-1)
+        increased_consumption = np.abs(updated_demand - window_demand)
+        window_demand = updated_demand
+        realised_demand = np.where(window, realised_demand * (1 - self.demand_flexibility * deficit_draws)[
+            ..., np.newaxis], realised_demand)
+        updated_demand = np.where(window, realised_demand, 0).sum(axis=-1)
+        reduced_consumption = np.abs(window_demand - updated_demand)
+        self.realised_demand = realised_demand
+        # Members that do not participate keep the shifted load of their last participation
+        self.shifted_load = np.where(participating, np.maximum(increased_consumption, reduced_consumption),
+                                     self.shifted_load)
+
+        # Consumers share one Series for scheduled and realised demand, so demand response shows up in both
+        consumer = ~self.is_prosumer[:, np.newaxis]
+        self.scheduled_demand = np.where(consumer, self.realised_demand, self.scheduled_demand)
+
+    @staticmethod
+    def get_replications():
+        """Returns the rows of the daily random variates used by the engine."""
+        return slice(None)
+
+    def release_tod_schedule(self, tomorrow):
+        """Releases the ToD windows of every replication for the next day."""
+        day_ahead_demand = self.day_ahead_demand.sum(axis=0)
+        day_ahead_supply = self.day_ahead_supply.sum(axis=0)
+        # Forecast error of the generation schedules, as in Coordinator.adjust_generation_schedule
+        forecast_error = np.where(self.model.forecast_direction_draws < 5, self.model.forecast_error_draws,
+                                  -self.model.forecast_error_draws)[:, np.newaxis]
+        self.model.tod_surplus_window = get_tod_window(day_ahead_supply * (1 + forecast_error))
+        self.model.tod_deficit_window = np.repeat(get_tod_window(day_ahead_demand)[np.newaxis], self.replications,
+                                                  axis=0)
+        self.model.tod_day = tomorrow
+
+
+class ReplicationView:
+    """
+    View of one replication of a batched engine. It exposes the model and engine attributes read by the data reporters,
+    so every replication can be collected like a separate model.
+    """
+
+    def __init__(self, model, replication):
+        """
+        :param model: EnergyCommunity: model advanced by a batched engine
+        :param replication: int: index of the replication
+        """
+        self.model = model
+        self.replication = replication
+        self.engine = self
+        self.all_assets = model.all_assets
+        self.member_keys = model.engine.member_keys
+        self.member_counts = model.engine.member_counts
+
+    @property
+    def date(self):
+        return self.model.date
+
+    @property
+    def realised_demand(self):
+        return self.model.engine.realised_demand[self.replication]
+
+    @property
+    def scheduled_demand(self):
+        return self.model.engine.scheduled_demand[self.replication]
+
+    @property
+    def shifted_load(self):
+        return self.model.engine.shifted_load[self.replication]
+
+    @property
+    def savings_ToD(self):
+        return self.model.engine.savings_ToD[self.replication]
+
+    @property
+    def energy_cost(self):
+        return self.model.engine.energy_cost[self.replication]
+
+    @property
+    def asset_supply(self):
+        return self.model.engine.asset_supply
+
+    @property
+    def energy_import(self):
+        return self.model.engine.energy_import[self.replication]
+
+    @property
+    def energy_export(self):
+        return self.model.engine.energy_export[self.replication]
+
+    @property
+    def self_consumption(self):
+        return self.model.engine.self_consumption[self.replication]
+
+    @property
+    def self_sufficiency(self):
+        return self.model.engine.self_sufficiency[self.replication]
+
+    def get_member_values(self, values):
+        return self.model.engine.get_member_values(values)
+
+
+def get_generation_coefficients(asset):
+    """
+    Returns the solar and wind generation coefficients of an asset.
+    :param asset: Asset: generation asset
+    :return: tuple: coefficient for direct irradiance and coefficient for cubed wind speed
+    """
+    if asset.asset_type is AssetType.SOLAR:
+        return asset.generation_coefficient(), 0
+    elif asset.asset_type is AssetType.WIND:
+        return 0, asset.generation_coefficient()
+    return 0, 0
+
+
+def compute_generation(solar_coefficient, wind_coefficient, direct, wind_speed):
+    """
+    Computes the generation schedules of members from the weather data.
+    :param solar_coefficient: ndarray: coefficient for direct irradiance of every member
+    :param wind_coefficient: ndarray: coefficient for cubed wind speed of every member
+    :param direct: ndarray: direct irradiance per slot, optionally for several days
+    :param wind_speed: ndarray: wind speed per slot, optionally for several days
+    :return: ndarray: ([days x] members x slots) generation schedules
+    """
+    wind_speed = np.where(wind_speed > 30, 0, wind_speed)  # Wind turbine shuts down above 30 m/s
+    return solar_coefficient[:, np.newaxis] * direct[..., np.newaxis, :] + \
+           wind_coefficient[:, np.newaxis] * np.power(wind_speed, 3)[..., np.newaxis, :]
+
+
+def compute_asset_supply(category_coefficients, direct, wind_speed):
+    """
+    Computes the total supply of every asset category.
+    :param category_coefficients: Dict: solar and wind coefficients of every asset category
+    :param direct: ndarray: direct irradiance per slot, optionally for several days
+    :param wind_speed: ndarray: wind speed per slot, optionally for several days
+    :return: Dict: supply of every asset category
+    """
+    wind_speed = np.where(wind_speed > 30, 0, wind_speed)
+    asset_supply = {}
+    for asset_category, (solar, wind) in category_coefficients.items():
+        asset_supply[asset_category] = solar * direct.sum(axis=-1) + wind * np.power(wind_speed, 3).sum(axis=-1)
+    return asset_supply
+
+
+def split_captive_consumption(scheduled_demand, generation_schedule, is_prosumer):
+    """
+    Splits the schedules of members into demand left after captive consumption and excess generation.
+    :param scheduled_demand: ndarray: ([days x] members x slots) demand schedules
+    :param generation_schedule: ndarray: ([days x] members x slots) generation schedules
+    :param is_prosumer: ndarray: whether each member consumes its own generation
+    :return:
+        realised_demand: ndarray: demand after captive consumption
+        excess_generation: ndarray: generation left after captive consumption
+    """
+    prosumer = is_prosumer[:, np.newaxis]
+    realised_demand = np.where(prosumer, (scheduled_demand - generation_schedule).clip(min=0), scheduled_demand)
+    excess_generation = np.where(prosumer, (generation_schedule - scheduled_demand).clip(min=0), 0)
+    return realised_demand, excess_generation
+
+
+def split_day_ahead_schedules(demand, generation):
+    """
+    Splits day-ahead schedules into demand and supply.
+    :param demand: ndarray: day-ahead demand schedules
+    :param generation: ndarray: day-ahead generation schedules
+    :return: tuple: day-ahead demand and day-ahead supply
+    """
+    return (demand - generation).clip(min=0), (generation - demand).clip(min=0)
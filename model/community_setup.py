@@ -3,10 +3,12 @@
 from model.agents import *
 
 
-def create_community_configuration(community_name='groene_mient'):
+def create_community_configuration(community_name='groene_mient', seed=None, cohorts=False):
     """
     This function creates a community configuration inspired by real energy communities/smart grid products.
     :param community_name: Name of the community
+    :param seed: int, SeedSequence or Generator: seed for choosing the household types, random if None
+    :param cohorts: Boolean: whether identical households are grouped into one cohort agent with a member count
     :return: List: list of agents and their respective assets
     """
     if community_name == 'groene_mient':
@@ -21,7 +23,9 @@ def create_community_configuration(community_name='groene_mient'):
         residential_agent = prepare_residential_agent_list(number_of_consumer_households=number_of_consumer_households,
                                                            number_of_prosumer_households=number_of_prosumer_households,
                                                            hh_types=None,
-                                                           asset_list=asset_list)
+                                                           asset_list=asset_list,
+                                                           seed=seed,
+                                                           cohorts=cohorts)
 
         # Setup Non-residential member
         non_residential_agents = [{'member_type': MemberType.NON_RESIDENTIAL,
@@ -47,7 +51,9 @@ def create_community_configuration(community_name='groene_mient'):
         residential_agent = prepare_residential_agent_list(number_of_consumer_households=number_of_consumer_households,
                                                            number_of_prosumer_households=number_of_prosumer_households,
                                                            hh_types=None,
-                                                           asset_list=asset_list)
+                                                           asset_list=asset_list,
+                                                           seed=seed,
+                                                           cohorts=cohorts)
 
         # Setup Non-residential member
         non_residential_agents = [{'member_type': MemberType.NON_RESIDENTIAL,
@@ -76,37 +82,73 @@ def create_community_configuration(community_name='groene_mient'):
 
 
 def prepare_residential_agent_list(number_of_consumer_households, number_of_prosumer_households, hh_types=None,
-                                   asset_list=None):
+                                   asset_list=None, seed=None, cohorts=False):
+    """
+    Prepares the residential members of a community. Every household gets one of the household types at random.
+    :param number_of_consumer_households: int: number of households without assets
+    :param number_of_prosumer_households: int: number of households owning the assets of the asset list
+    :param hh_types: list: names of the household demand profiles
+    :param asset_list: list: assets owned by every prosumer household
+    :param seed: int, SeedSequence or Generator: seed for choosing the household types, random if None
+    :param cohorts: Boolean: whether households with the same household type and agent type are grouped into one
+    cohort agent with a member count, instead of one agent per household
+    :return: List: list of residential agents
+    """
     if hh_types is None:
         hh_types = ['hh1_consumption [kWh]', 'hh2_consumption [kWh]', 'hh3_consumption [kWh]']
 
     residential_agents = []
+    # Household types of all households are drawn at once, consumers first
+    rng = np.random.default_rng(seed)
+    number_of_households = number_of_consumer_households + number_of_prosumer_households
+    household_types = [hh_types[choice] for choice in rng.integers(len(hh_types), size=number_of_households)]
 
-    for _ in range(number_of_consumer_households):
-        residential_agents.append({'member_name': random.choice(hh_types),
+    for household in range(number_of_consumer_households):
+        residential_agents.append({'member_name': household_types[household],
                                    'member_type': MemberType.RESIDENTIAL,
                                    'agent_type': AgentType.CONSUMER,
                                    'demand_flexibility': 0.20,
                                    'asset_list': None})
     if asset_list is not None:
-        for _ in range(number_of_prosumer_households):
-            residential_agents.append({'member_name': random.choice(hh_types),
+        for household in range(number_of_prosumer_households):
+            residential_agents.append({'member_name': household_types[number_of_consumer_households + household],
                                        'member_type': MemberType.RESIDENTIAL,
                                        'agent_type': AgentType.PROSUMER,
                                        'demand_flexibility': 0.20,
                                        'asset_list': asset_list})
+    if cohorts:
+        residential_agents = group_into_cohorts(residential_agents)
     return residential_agents
 
 
-def generate_agent_list():
+def group_into_cohorts(agent_list):
+    """
+    Groups identical members into cohort agents. Members are identical when they have the same name, member type,
+    agent type, demand flexibility and assets, so the members of a cohort share one demand profile and asset spec.
+    :param agent_list: list: members of a community
+    :return: List: one member per cohort, with the number of members of the cohort as member count
+    """
+    cohorts = {}
+    for agent_details in agent_list:
+        key = (agent_details['member_name'], agent_details['member_type'], agent_details['agent_type'],
+               agent_details['demand_flexibility'], repr(agent_details['asset_list']))
+        if key in cohorts:
+            cohorts[key]['member_count'] += agent_details.get('member_count', 1)
+        else:
+            cohorts[key] = dict(agent_details, member_count=agent_details.get('member_count', 1))
+    return list(cohorts.values())
+
+
+def generate_agent_list(seed=None):
     # Setup Residential Agents
 
     # Household types is chosen randomly from the list of possible household types
     number_of_households = 2
     hh_types = ['hh1_consumption [kWh]', 'hh2_consumption [kWh]', 'hh3_consumption [kWh]']
     residential_agents = []
-    for _ in range(number_of_households):
-        residential_agents.append({'member_name': random.choice(hh_types),
+    rng = np.random.default_rng(seed)
+    for choice in rng.integers(len(hh_types), size=number_of_households):
+        residential_agents.append({'member_name': hh_types[choice],
                                    'member_type': MemberType.RESIDENTIAL,
                                    'agent_type': AgentType.CONSUMER,
                                    'demand_flexibility': 0.20,
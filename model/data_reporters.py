@@ -1,15 +1,25 @@
 """This file contains the DataReporter class."""
 
+import collections
 import json
 
 from model.agents import *
 
+# Metrics reported for every community member and for every asset category
+MEMBER_METRICS = ['M1: realised_demand', 'M2: scheduled_demand', 'M3: shifted_load', 'M5: savings_on_ToD',
+                  'M6: energy_costs']
+GENERATION_METRIC = 'M4: total_generation'
+# Metrics reported for the community as a whole
+COMMUNITY_METRICS = ['M7: energy_import', 'M8: energy_export', 'M9: self_consumption', 'M10: self_sufficiency']
+
 
 def get_realised_demand(self):
     """
     Returns the total daily realised energy demand for every agent type.
     :return: Dict: total energy demand per agent type
     """
+    if self.engine is not None:
+        return self.engine.get_member_values(self.engine.realised_demand.sum(axis=1))
     members = [AgentType.CONSUMER, AgentType.PROSUMER]
     demand_dict = {}
     for agent in self.schedule.agents:
@@ -25,19 +35,34 @@ def get_scheduled_demand(self):
     :param self:
     :return:
     """
+    if self.engine is not None:
+        return self.engine.get_member_values(sum_schedule(self.engine.scheduled_demand))
     members = [AgentType.CONSUMER, AgentType.PROSUMER]
     demand_dict = {}
     for agent in self.schedule.agents:
         if agent.agent_type in members:
             key = str(agent.member_name) + str('_') + str(agent.unique_id)
-            demand_dict[key] = agent.scheduled_demand.sum(min_count=1)
+            demand_dict[key] = sum_schedule(agent.scheduled_demand)
     return demand_dict
 
 
+def sum_schedule(schedule):
+    """
+    Sums schedules over their slots like Series.sum(min_count=1): missing slots are skipped, and the sum of a
+    schedule without values is nan instead of 0.
+    :param schedule: ndarray: ([members x] slots) schedules
+    :return: ndarray or float: sum of every schedule
+    """
+    missing = np.isnan(schedule).all(axis=-1)
+    return np.where(missing, np.nan, np.nansum(schedule, axis=-1))[()]
+
+
 def get_shifted_load(self):
     """"
     Returns the demand shifted by the community members participating in the demand response.
     """
+    if self.engine is not None:
+        return json.dumps(self.engine.get_member_values(self.engine.shifted_load))
     members = [AgentType.CONSUMER, AgentType.PROSUMER]
     shifted_load = {}
     for agent in self.schedule.agents:
@@ -53,20 +78,39 @@ def get_generation(self):
     :return: a dict of total energy supply per generator type
     """
     generation_dict = {}
+    if self.engine is not None:
+        for asset_category, supply in self.engine.asset_supply.items():
+            generation_dict[str(asset_category)] = float(supply)
+        return json.dumps(generation_dict)
     for asset_category in self.all_assets.keys():
-        supply = 0
-        for asset in self.all_assets[asset_category]:
-            supply += asset.supply_schedule.sum()
-        generation_dict[str(asset_category)] = supply
+        generation_dict[str(asset_category)] = get_category_supply(self, asset_category)
     return json.dumps(generation_dict)
 
 
+def get_category_supply(self, asset_category):
+    """
+    Returns the total daily supply of the assets of a category from the generation cache. Identical assets share one
+    generation profile, so it is read once and multiplied by the number of assets.
+    :param asset_category: type: asset category
+    :return: float: total supply of the category
+    """
+    generation_cache = get_generation_cache()
+    day = self.calendar.get_day_index(self.tick)
+    supply_keys = collections.Counter()
+    for asset in self.all_assets[asset_category]:
+        # The asset of a cohort agent stands for one asset per member of the cohort
+        supply_keys[asset.get_supply_key()] += asset.owner.member_count
+    return float(sum(count * generation_cache.get_daily_supply(key, day) for key, count in supply_keys.items()))
+
+
 def get_savings(self):
     """
     Returns savings made by community member by complying to ToD schedule as a part of demand response.
     :param self: a dict of savings on energy cost through ToD compliance per timestep
     :return:
     """
+    if self.engine is not None:
+        return json.dumps(self.engine.get_member_values(self.engine.savings_ToD))
     savings_dict = {}
     members = [AgentType.CONSUMER, AgentType.PROSUMER]
     for agent in self.schedule.agents:
@@ -82,6 +126,8 @@ def get_energy_cost(self):
     :param self:
     :return:  a dict of energy cost for member per timestep
     """
+    if self.engine is not None:
+        return json.dumps(self.engine.get_member_values(self.engine.energy_cost))
     costs_dict = {}
     members = [AgentType.CONSUMER, AgentType.PROSUMER]
     for agent in self.schedule.agents:
@@ -91,8 +137,113 @@ def get_energy_cost(self):
     return json.dumps(costs_dict)
 
 
+def get_energy_import(self):
+    """
+    Returns the electricity imported by the community from the grid.
+    :return: float: energy import
+    """
+    return get_community_value(self, 'energy_import', 'total_energy_import')
+
+
+def get_energy_export(self):
+    """
+    Returns the electricity exported by the community to the grid.
+    :return: float: energy export
+    """
+    return get_community_value(self, 'energy_export', 'total_energy_export')
+
+
+def get_self_consumption(self):
+    """
+    Returns the share of the generation of community members consumed within the community.
+    :return: float: self-consumption
+    """
+    return get_community_value(self, 'self_consumption', 'self_consumption')
+
+
+def get_self_sufficiency(self):
+    """
+    Returns the share of the consumption of community members supplied by the community.
+    :return: float: self-sufficiency
+    """
+    return get_community_value(self, 'self_sufficiency', 'self_sufficiency')
+
+
+def get_community_value(self, engine_attribute, coordinator_attribute):
+    """
+    Returns a community outcome computed by the array engine or by the coordinator.
+    :param engine_attribute: string: name of the outcome in the array engine
+    :param coordinator_attribute: string: name of the outcome in the coordinator
+    :return: float: outcome of the day, NaN if the community has no coordinator
+    """
+    if self.engine is not None:
+        return float(getattr(self.engine, engine_attribute))
+    if self.coordinator is None or getattr(self.coordinator, coordinator_attribute) is None:
+        return np.nan
+    return getattr(self.coordinator, coordinator_attribute)
+
+
 def get_date(self):
     """"
     Returns the date for the model simulation
     """
     return self.date
+
+
+def get_member_keys(self):
+    """
+    Returns the reporter key of every community member.
+    :return: list: keys in the order of the schedule
+    """
+    if self.engine is not None:
+        return list(self.engine.member_keys)
+    members = [AgentType.CONSUMER, AgentType.PROSUMER]
+    return [str(agent.member_name) + str('_') + str(agent.unique_id) for agent in self.schedule.agents if
+            agent.agent_type in members]
+
+
+def get_member_counts(self):
+    """
+    Returns the number of households of every community member, more than 1 for cohort agents.
+    :return: ndarray: member counts in the order of the reporter keys
+    """
+    if self.engine is not None:
+        return self.engine.member_counts
+    return self.member_counts
+
+
+def get_member_metrics(self):
+    """
+    Returns the realised demand, scheduled demand, shifted load, savings on ToD and energy cost of every community
+    member.
+    :return: ndarray: (members x metrics) values in the order of MEMBER_METRICS
+    """
+    if self.engine is not None:
+        engine = self.engine
+        return np.stack([engine.realised_demand.sum(axis=1), sum_schedule(engine.scheduled_demand),
+                         engine.shifted_load, engine.savings_ToD, engine.energy_cost], axis=1)
+    members = [AgentType.CONSUMER, AgentType.PROSUMER]
+    values = [[agent.realised_demand.sum(), sum_schedule(agent.scheduled_demand), agent.shifted_load,
+               agent.savings_ToD, agent.energy_cost] for agent in self.schedule.agents if agent.agent_type in members]
+    return np.array(values, dtype=float)
+
+
+def get_generation_values(self):
+    """
+    Returns the total daily supply of every asset category.
+    :return: ndarray: supply in the order of the asset categories of the model
+    """
+    if self.engine is not None:
+        return np.array([self.engine.asset_supply[asset_category] for asset_category in self.all_assets.keys()],
+                        dtype=float)
+    return np.array([get_category_supply(self, asset_category) for asset_category in self.all_assets.keys()],
+                    dtype=float)
+
+
+def get_community_values(self):
+    """
+    Returns the energy import, energy export, self-consumption and self-sufficiency of the community.
+    :return: ndarray: values in the order of COMMUNITY_METRICS
+    """
+    return np.array([get_energy_import(self), get_energy_export(self), get_self_consumption(self),
+                     get_self_sufficiency(self)], dtype=float)
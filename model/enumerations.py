@@ -27,3 +27,30 @@ class AssetType(Enum):
     SOLAR = 1
     WIND = 2
     BATTERY_STORAGE = 3
+
+
+class EngineType(Enum):
+    """
+    Engine used for advancing the energy community.
+    """
+    AGENT = 1
+    ARRAY = 2
+
+
+class CollectorType(Enum):
+    """
+    Collector of the model outputs.
+    """
+    DATACOLLECTOR = 1
+    RESULT_STORE = 2
+    RESULT_STREAM = 3
+
+
+class Phase(Enum):
+    """
+    Phase of a model step, run in this order.
+    """
+    ASSETS = 1
+    MEMBERS = 2
+    COORDINATOR = 3
+    COLLECTION = 4
@@ -0,0 +1,69 @@
+"""
+This module contains the generation cache of the model.
+"""
+
+import numpy as np
+
+from model.input_data import get_input_data
+
+# Conversion of a weather column into generation
+LINEAR = 'linear'  # Generation proportional to the column, e.g. direct irradiance for solar panels
+CUBED = 'cubed'  # Generation proportional to the cubed column, with a shutdown above 30 m/s for wind turbines
+
+# Generation caches of the input data that has been loaded
+generation_caches = {}
+
+
+class GenerationCache:
+    """
+    Generation profiles of asset specifications for every day of the input data. A profile is keyed by the weather
+    column it is computed from, its conversion and the generation coefficient of the asset. It is computed for all days
+    in bulk the first time any asset with that specification asks for it, and shared by all identical assets of all
+    models afterwards.
+    """
+
+    def __init__(self, input_data):
+        """
+        :param input_data: InputData: input data the profiles are computed from
+        """
+        self.input_data = input_data
+        self.profiles = {}
+        self.daily_supply = {}
+
+    def get_profile(self, key):
+        """
+        Returns the generation profile of an asset specification.
+        :param key: tuple: weather column, conversion and generation coefficient
+        :return: ndarray: read-only (days x slots) generation
+        """
+        if key not in self.profiles:
+            column, conversion, coefficient = key
+            values = self.input_data.values[:, :, self.input_data.columns[column]]
+            if conversion == CUBED:
+                values = np.power(np.where(values <= 30, values, 0), 3)
+            profile = coefficient * values
+            profile.flags.writeable = False
+            self.profiles[key] = profile
+            self.daily_supply[key] = profile.sum(axis=1)
+        return self.profiles[key]
+
+    def get_daily_supply(self, key, day):
+        """
+        Returns the total generation of an asset specification for a day.
+        :param key: tuple: weather column, conversion and generation coefficient
+        :param day: int: index of the day in the input data
+        :return: float: total generation of the day
+        """
+        self.get_profile(key)
+        return self.daily_supply[key][day]
+
+
+def get_generation_cache():
+    """
+    Returns the generation cache of the input data, shared by all models.
+    :return: GenerationCache: generation cache
+    """
+    input_data = get_input_data()
+    if input_data not in generation_caches:
+        generation_caches[input_data] = GenerationCache(input_data)
+    return generation_caches[input_data]
@@ -0,0 +1,275 @@
+"""
+This module contains the preindexed input data of the model.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+SLOTS_PER_DAY = 96
+
+# Directory of the processed data, relative to the repository unless set by the environment
+DATA_DIRECTORY = os.environ.get('ENERGY_COMMUNITY_DATA_DIRECTORY', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'processed'))
+INPUT_DATA_FILE = 'model_input_data.csv'
+ELECTRICITY_COSTS_FILE = 'electricity_costs.csv'
+
+
+class InputData:
+    """
+    Dense (day x slot x column) array of the 15-minute model input data with integer day indices. Lookups return
+    read-only views into the array instead of slicing a DataFrame by date strings.
+    """
+
+    def __init__(self, values, columns, dates):
+        """
+        Initialize the input data from a dense array.
+        :param values: ndarray: (day x slot x column) values
+        :param columns: list: name of every column
+        :param dates: list: date of every day in format "YYYY-MM-DD"
+        """
+        self.columns = {column: position for position, column in enumerate(columns)}
+        self.dates = list(dates)
+        self.day_index = {date: day for day, date in enumerate(self.dates)}
+        self.values = values
+        self.values.flags.writeable = False
+        self.slot_indexes = {}
+
+    @classmethod
+    def from_dataframe(cls, data):
+        """
+        Convert the input data into a dense array.
+        :param data: DataFrame: 15-minute input data indexed by timestamp
+        :return: InputData: preindexed input data
+        """
+        data = data.select_dtypes(include='number')
+        data = data[~data.index.duplicated(keep='first')].sort_index()
+        first_day = data.index[0].normalize()
+        number_of_days = (data.index[-1].normalize() - first_day).days + 1
+        index = pd.date_range(start=first_day, periods=number_of_days * SLOTS_PER_DAY, freq='15min')
+        # Missing slots do not contribute to the daily totals
+        data = data.reindex(index, fill_value=0)
+
+        values = data.to_numpy(dtype=float).reshape(number_of_days, SLOTS_PER_DAY, len(data.columns))
+        return cls(values, data.columns.to_list(), index[::SLOTS_PER_DAY].strftime('%Y-%m-%d').to_list())
+
+    def save(self, path):
+        """
+        Saves the input data in binary files: the values in a .npy file that can be memory-mapped, and the columns and
+        dates in an _index.npz file, which is written last. Files are written to temporary files first, so processes
+        loading at the same time never read partial files.
+        :param path: string: path of the files without extension
+        """
+        columns = np.array(list(self.columns.keys()))
+        write_atomically(f'{path}.npy', lambda file: np.save(file, self.values))
+        write_atomically(f'{path}_index.npz', lambda file: np.savez(file, columns=columns, dates=np.array(self.dates)))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads input data saved by InputData.save. The values are memory-mapped read-only, so all processes on a host
+        share one copy in the page cache, and only the pages of the days that are used are read.
+        :param path: string: path of the files without extension
+        :return: InputData: preindexed input data
+        """
+        with np.load(f'{path}_index.npz') as data:
+            columns, dates = data['columns'].tolist(), data['dates'].tolist()
+        # A plain view of the mapped file, so results computed from it are ordinary arrays
+        values = np.asarray(np.load(f'{path}.npy', mmap_mode='r'))
+        return cls(values, columns, dates)
+
+    def get_day_index(self, date):
+        """
+        Returns the integer index of a day.
+        :param date: string: date in format "YYYY-MM-DD"
+        :return: int: index of the day in the array
+        """
+        return self.day_index[date]
+
+    def get_schedule(self, day, column):
+        """
+        Returns the values of a column for a day.
+        :param day: int: index of the day in the array
+        :param column: string: name of the column
+        :return: ndarray: read-only view of the 96 slots of the day
+        """
+        return self.values[day, :, self.columns[column]]
+
+    def get_slot_index(self, day):
+        """
+        Returns the timestamps of the slots of a day. Indexes are built once per day and shared.
+        :param day: int: index of the day in the array
+        :return: DatetimeIndex: 96 timestamps of the day
+        """
+        if day not in self.slot_indexes:
+            self.slot_indexes[day] = pd.date_range(start=self.dates[day], periods=SLOTS_PER_DAY, freq='15min')
+        return self.slot_indexes[day]
+
+
+class DataProvider:
+    """
+    Provides the input data and electricity costs of the model. Files are read on first use from a data directory.
+    The parsed input data is cached in binary files keyed by the hash of the csv file, so later imports and worker
+    processes skip parsing the csv file and memory-map the same values.
+    """
+
+    def __init__(self, data_directory=DATA_DIRECTORY, cache_directory=None):
+        """
+        :param data_directory: string: directory of the processed data
+        :param cache_directory: string: directory of the binary cache, defaults to a cache folder in the data directory
+        """
+        self.data_directory = data_directory
+        if cache_directory is None:
+            cache_directory = os.path.join(data_directory, 'cache')
+        self.cache_directory = cache_directory
+        self._input_data = None
+        self._electricity_costs = None
+        self._data_hash = None
+
+    @property
+    def input_data(self):
+        """InputData: preindexed 15-minute input data"""
+        if self._input_data is None:
+            self._input_data = load_cached_input_data(os.path.join(self.data_directory, INPUT_DATA_FILE),
+                                                      self.cache_directory)
+        return self._input_data
+
+    @property
+    def electricity_costs(self):
+        """Dict: electricity costs of every month"""
+        if self._electricity_costs is None:
+            electricity_costs = pd.read_csv(os.path.join(self.data_directory, ELECTRICITY_COSTS_FILE), index_col=1)
+            self._electricity_costs = electricity_costs.to_dict(orient='index')
+        return self._electricity_costs
+
+    @property
+    def data_hash(self):
+        """string: hash of the content of the input data and electricity costs files"""
+        if self._data_hash is None:
+            file_hashes = [get_file_hash(os.path.join(self.data_directory, file_name)) for file_name in
+                           [INPUT_DATA_FILE, ELECTRICITY_COSTS_FILE]]
+            self._data_hash = hashlib.sha256(''.join(file_hashes).encode()).hexdigest()[:16]
+        return self._data_hash
+
+
+data_provider = DataProvider()
+
+
+def set_data_directory(data_directory, cache_directory=None):
+    """
+    Reads the input data and electricity costs from another directory.
+    :param data_directory: string: directory of the processed data
+    :param cache_directory: string: directory of the binary cache, defaults to a cache folder in the data directory
+    """
+    global data_provider
+    data_provider = DataProvider(data_directory, cache_directory)
+
+
+def get_input_data():
+    """
+    Returns the input data of the model, loading it on first use.
+    :return: InputData: preindexed input data
+    """
+    return data_provider.input_data
+
+
+def get_electricity_costs():
+    """
+    Returns the electricity costs of every month, loading them on first use.
+    :return: Dict: electricity costs of every month
+    """
+    return data_provider.electricity_costs
+
+
+def get_data_hash():
+    """
+    Returns the hash of the files the input data and electricity costs are read from.
+    :return: string: hash of the content of the files
+    """
+    return data_provider.data_hash
+
+
+def load_input_data(path):
+    """
+    Reads the 15-minute model input data from a csv file.
+    :param path: string: path of the csv file
+    :return: InputData: preindexed input data
+    """
+    data = pd.read_csv(path, parse_dates=['Local'], index_col=0)
+    return InputData.from_dataframe(data)
+
+
+def load_cached_input_data(path, cache_directory):
+    """
+    Reads the model input data from the binary cache of a csv file, parsing and caching the csv file if it has
+    changed. Cached values are memory-mapped, also right after caching, so worker processes forked or started later
+    share them with this process. The cache files of earlier versions of the csv file are removed once the new
+    version is cached. The parsed input data is returned if the cache cannot be written.
+    :param path: string: path of the csv file
+    :param cache_directory: string: directory of the binary cache
+    :return: InputData: preindexed input data
+    """
+    file_name = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(cache_directory, f'{file_name}_{get_file_hash(path)}')
+    if os.path.isfile(f'{cache_path}_index.npz'):
+        return InputData.load(cache_path)
+
+    input_data = load_input_data(path)
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        input_data.save(cache_path)
+    except OSError:
+        return input_data
+    remove_outdated_cache_files(cache_directory, file_name, os.path.basename(cache_path))
+    return InputData.load(cache_path)
+
+
+def remove_outdated_cache_files(cache_directory, file_name, current_name):
+    """
+    Removes the cache files of other versions of a csv file. Processes that still map removed values keep reading
+    them until they exit. Files that cannot be removed are left for a later run.
+    :param cache_directory: string: directory of the binary cache
+    :param file_name: string: name of the csv file without extension
+    :param current_name: string: name of the cache files of the current version without extension
+    """
+    pattern = re.compile(rf'{re.escape(file_name)}_[0-9a-f]{{16}}(\.npy|_index\.npz|\.npz)')
+    current_files = {f'{current_name}.npy', f'{current_name}_index.npz'}
+    for name in os.listdir(cache_directory):
+        if pattern.fullmatch(name) and name not in current_files:
+            try:
+                os.remove(os.path.join(cache_directory, name))
+            except OSError:
+                pass
+
+
+def write_atomically(path, write):
+    """
+    Writes a file through a temporary file in the same directory, so it is either complete or missing.
+    :param path: string: path of the file
+    :param write: function: writes the content to an open binary file
+    """
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            write(file)
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def get_file_hash(path):
+    """
+    Returns the hash of the content of a file.
+    :param path: string: path of the file
+    :return: string: first 16 characters of the SHA-256 hex digest
+    """
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()[:16]
@@ -1,11 +1,17 @@
 # import datetime
+import os
 import time
 
 from mesa import Model
-from mesa.time import BaseScheduler
 from mesa.datacollection import DataCollector
 
 from model.data_reporters import *
+from model.community_engine import CommunityEngine, BatchedCommunityEngine, ReplicationView
+from model.scheduler import PhasedScheduler
+from model.result_store import create_result_store
+from model.result_stream import create_result_stream
+from model.tick_calendar import TickCalendar
+from model.tariffs import get_monthly_tariff
 
 
 class EnergyCommunity(Model):
@@ -17,7 +23,14 @@ class EnergyCommunity(Model):
                  levers=None,
                  uncertainties=None,
                  agents_list=None,
-                 start_date=None, ):
+                 start_date=None,
+                 engine=EngineType.AGENT,
+                 trajectories=None,
+                 collector=CollectorType.DATACOLLECTOR,
+                 replications=1,
+                 seed_sequence=None,
+                 tariff=None,
+                 result_directory=None, ):
         super().__init__()
 
         if levers is None:
@@ -46,20 +59,65 @@ class EnergyCommunity(Model):
 
         if start_date is None:
             start_date = datetime.datetime(2021, 1, 1)
-        self.date = start_date.strftime('%Y-%m-%d')
-        self.date_index = pd.date_range(start=self.date, periods=96, freq='15min')
+        # Dates, months and days of the input data of all ticks are looked up in the calendar
+        self.calendar = TickCalendar(start_date)
+        self.date = self.calendar.get_date(0)
+        self.date_index = self.calendar.get_slot_index(0)
+        # Electricity prices of every day, monthly tariffs unless a tariff with dynamic prices is given
+        self.tariff = tariff
+        if self.tariff is None:
+            self.tariff = get_monthly_tariff()
 
         self.demand_availability = {'minimum': self.uncertainties['X1'],
                                     'maximum': self.uncertainties['X2']}
         self.participation_in_tod = self.levers['L1']
         self.tick = 0
-        self.tod_surplus_timing = None  # Time of day when surplus electricity is available
-        self.tod_deficit_timing = None  # Time of day when electricity is needed from the grid
+        # ToD windows as slot masks and the day of the input data they apply to
+        self.tod_surplus_window = np.zeros(SLOTS_PER_DAY, dtype=bool)  # Slots when surplus electricity is available
+        self.tod_deficit_window = np.zeros(SLOTS_PER_DAY, dtype=bool)  # Slots when electricity is needed from the grid
+        self.tod_day = None
         self.agent_list = agents_list
-        self.schedule = BaseScheduler(self)
+        self.schedule = PhasedScheduler(self)
         self.all_assets = {}
+        self.member_schedules = None
+        self.number_of_members = 0
+        self.member_counts = []  # Number of households of every member, more than 1 for cohort agents
+        self.coordinator = None
         self.create_agents()
-        self.datacollector = DataCollector(model_reporters={
+        self.member_counts = np.array(self.member_counts, dtype=int)
+
+        # Every replication draws its random variates from its own generator, spawned from the seed sequence
+        self.replications = replications
+        if replications > 1 and not isinstance(seed_sequence, list):
+            seed_sequence = np.random.SeedSequence(seed_sequence).spawn(replications)
+        elif replications == 1:
+            seed_sequence = [seed_sequence]
+        if len(seed_sequence) != replications:
+            raise ValueError('Batched replications require one seed sequence per replication')
+        self.generators = [np.random.default_rng(seed) for seed in seed_sequence]
+        self.rng = self.generators[0]
+        self.participation_draws = None
+        self.participants = None
+        self.surplus_draws = None
+        self.deficit_draws = None
+        self.forecast_direction_draws = None
+        self.forecast_error_draws = None
+
+        # The array engine advances all members at once instead of stepping the agents one by one
+        self.engine = None
+        if engine is EngineType.ARRAY and replications > 1:
+            self.engine = BatchedCommunityEngine(self, replications, trajectories)
+        elif engine is EngineType.ARRAY:
+            self.engine = CommunityEngine(self, trajectories)
+        elif trajectories is not None:
+            raise ValueError('Precomputed trajectories require the array engine')
+        elif replications > 1:
+            raise ValueError('Batched replications require the array engine')
+        # Every replication of a batched engine is collected like a separate model
+        self.replication_views = [self]
+        if replications > 1:
+            self.replication_views = [ReplicationView(self, replication) for replication in range(replications)]
+        model_reporters = {
             "date": get_date,
             # date or the time step for the model simulation
             "M1: realised_demand": get_realised_demand,
@@ -72,23 +130,87 @@ class EnergyCommunity(Model):
             # generation from the renewable assets in the simulation model
             "M5: savings_on_ToD": get_savings,
             # savings made by avoiding import of electricity from grid by community members
-            "M6: energy_costs": get_energy_cost
+            "M6: energy_costs": get_energy_cost,
             # total expenses made by community members for procuring electricity from the grid
-        })
+            "M7: energy_import": get_energy_import,
+            # electricity imported by the community from the grid
+            "M8: energy_export": get_energy_export,
+            # electricity exported by the community to the grid
+            "M9: self_consumption": get_self_consumption,
+            # share of the generation of community members consumed within the community
+            "M10: self_sufficiency": get_self_sufficiency
+            # share of the consumption of community members supplied by the community
+        }
+        # The result store writes the same metrics into preallocated arrays instead of the DataCollector, the result
+        # stream writes them to disk in chunks during the run
+        self.result_store = None
+        self.result_stream = None
+        self.datacollector = None
+        if collector is CollectorType.RESULT_STORE:
+            self.collectors = [create_result_store(view) for view in self.replication_views]
+            self.result_store = self.collectors[0]
+        elif collector is CollectorType.RESULT_STREAM:
+            if result_directory is None:
+                raise ValueError('The result stream requires a result directory')
+            directories = [result_directory]
+            if isinstance(result_directory, list):
+                directories = result_directory
+            elif replications > 1:
+                directories = [os.path.join(result_directory, f'replication_{replication}') for replication in
+                               range(replications)]
+            self.collectors = [create_result_stream(view, directory) for view, directory in
+                               zip(self.replication_views, directories)]
+            self.result_stream = self.collectors[0]
+        else:
+            self.collectors = [DataCollector(model_reporters=model_reporters) for _ in self.replication_views]
+            self.datacollector = self.collectors[0]
 
     def step(self):
         """Advance the model by one step."""
         super().step()
-        self.schedule.step()
-        self.datacollector.collect(self)
+        self.draw_variates()
+        if self.engine is not None:
+            self.engine.step()
+            self.collect()
+        else:
+            # Assets, members, coordinator and collection of the outputs, in this order
+            self.schedule.step()
         self.tick += 1
-        self.date = self.tick_to_date(self.tick)
+        self.date = self.calendar.get_date(self.tick)
+        self.date_index = self.calendar.get_slot_index(self.tick)
+
+    def draw_variates(self):
+        """
+        Draws the random variates of all members and the coordinator for the day in bulk, with one row per replication.
+        The same number of variates is drawn every day whatever the levers, so runs with the same seed sequence use
+        common random numbers across experiment conditions.
+        """
+        members = self.number_of_members
+        uniforms = np.array([rng.random(3 * members + 2) for rng in self.generators])
+        minimum = self.demand_availability['minimum']
+        maximum = self.demand_availability['maximum']
+        self.participation_draws = uniforms[:, :members]
+        self.participants = draw_participants(self.participation_draws, self.member_counts, self.participation_in_tod)
+        self.surplus_draws = scale_uniforms(uniforms[:, members:2 * members], minimum, maximum)
+        self.deficit_draws = scale_uniforms(uniforms[:, 2 * members:3 * members], minimum, maximum)
+        self.forecast_direction_draws = uniforms[:, 3 * members]
+        self.forecast_error_draws = scale_uniforms(uniforms[:, 3 * members + 1], 0.5, self.uncertainties['X3'])
+
+    def collect(self):
+        """Collects the outputs of the current step of every replication."""
+        for view, collector in zip(self.replication_views, self.collectors):
+            collector.collect(view)
 
     def create_agents(self):
         """Create agents and add them to the schedule."""
+        # Schedules of all members in one (schedules x members x slots) array, members hold views of their rows
+        number_of_members = sum(agent_details['member_type'] is not MemberType.COORDINATOR for agent_details in
+                                self.agent_list)
+        self.member_schedules = np.zeros((len(MEMBER_SCHEDULES), number_of_members, SLOTS_PER_DAY))
         for agent_details in self.agent_list:
             if agent_details['member_type'] is MemberType.COORDINATOR:
                 agent = Coordinator(unique_id=self.next_id(), model=self)
+                self.coordinator = agent
             else:
                 agent = Member(unique_id=self.next_id(),
                                member_name=agent_details['member_name'],
@@ -97,7 +219,13 @@ class EnergyCommunity(Model):
                                demand_flexibility=self.select_demand_flexibility(
                                    member_type=agent_details['member_type']),
                                asset_list=agent_details['asset_list'],
+                               member_count=agent_details.get('member_count', 1),
                                model=self)
+                # Position of the member in the daily random variates
+                agent.member_index = self.number_of_members
+                agent.attach_schedules(self.member_schedules[:, agent.member_index])
+                self.number_of_members += 1
+                self.member_counts.append(agent.member_count)
             self.schedule.add(agent)
         return None
 
@@ -110,17 +238,26 @@ class EnergyCommunity(Model):
             demand_flexibility = self.levers['L3']
         return demand_flexibility
 
-    def run_simulation(self, steps=365, time_tracking=False, debug=False):
+    def run_simulation(self, steps=365, time_tracking=False, debug=False, per_household=False):
         """
         Runs the model for a specific amount of steps.
         :param steps: int: number of steps (in years)
         :param time_tracking: Boolean
         :param debug: Boolean
+        :param per_household: Boolean: whether member metrics of cohort agents are reported per household instead of
+        per cohort. Requires the result store.
         :return:
-            output: Dataframe: all information that the datacollector gathered
+            output: Dataframe: all information that the datacollector or the result store gathered, or a list with
+            one Dataframe per replication when replications are batched. With the result stream, the directory the
+            results were written to, or a list with one directory per replication.
         """
 
+        if per_household and self.result_store is None:
+            raise ValueError('Per-household results require the result store')
         start_time = time.time()
+        if self.result_store is not None:
+            for result_store in self.collectors:
+                result_store.reserve(result_store.steps_collected + steps)
 
         for tick in range(steps):
             if debug:
@@ -134,7 +271,16 @@ class EnergyCommunity(Model):
 
             print('Simulation completed!')
 
-        results = self.datacollector.get_model_vars_dataframe()
+        if self.result_stream is not None:
+            for result_stream in self.collectors:
+                result_stream.flush()
+            results = [result_stream.directory for result_stream in self.collectors]
+        elif self.result_store is not None:
+            results = [result_store.to_dataframe(per_household) for result_store in self.collectors]
+        else:
+            results = [datacollector.get_model_vars_dataframe() for datacollector in self.collectors]
+        if self.replications == 1:
+            return results[0]
         return results
 
     @staticmethod
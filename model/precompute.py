@@ -0,0 +1,76 @@
+"""
+This module contains the precomputation of lever-invariant community trajectories.
+"""
+
+from model.model_code import *
+from model.community_engine import *
+
+
+class CommunityTrajectories:
+    """
+    Lever-invariant trajectories of a community configuration for every day of the input data: demand and generation
+    schedules, demand left after captive consumption, excess generation, day-ahead schedules and the supply of every
+    asset category. None of these depend on the levers or uncertainties, so they are computed once and shared by all
+    simulation runs of the community. Members with the same demand profile, member type and generation assets share a
+    trajectory.
+    """
+
+    def __init__(self, profiles, category_coefficients):
+        """
+        Compute the trajectories for all days at once.
+        :param profiles: list: demand column, member type and generation coefficients of every trajectory
+        :param category_coefficients: Dict: solar and wind coefficients of every asset category
+        """
+        self.profiles = profiles
+        self.category_coefficients = category_coefficients
+        columns = np.array([profile[0] for profile in profiles], dtype=int)
+        is_prosumer = np.array([profile[1] for profile in profiles], dtype=bool)
+        solar_coefficient = np.array([profile[2] for profile in profiles], dtype=float)
+        wind_coefficient = np.array([profile[3] for profile in profiles], dtype=float)
+
+        input_data = get_input_data()
+        direct = input_data.values[:, :, input_data.columns['Direct [W/m^2]']]
+        wind_speed = input_data.values[:, :, input_data.columns['Wind [m/s]']]
+        demand = np.ascontiguousarray(input_data.values[:, :, columns].transpose(0, 2, 1))
+
+        # (days x trajectories x slots) schedules
+        self.scheduled_demand = demand
+        self.generation_schedule = compute_generation(solar_coefficient, wind_coefficient, direct, wind_speed)
+        self.realised_demand, self.excess_generation = split_captive_consumption(self.scheduled_demand,
+                                                                                 self.generation_schedule,
+                                                                                 is_prosumer)
+        # Day-ahead schedules of a day are made with the data of the next day, so the last day has none
+        day_ahead_generation = compute_generation(solar_coefficient, wind_coefficient, direct[1:], direct[1:])
+        self.day_ahead_demand, self.day_ahead_supply = split_day_ahead_schedules(demand[1:], day_ahead_generation)
+        # (days) supply of every asset category
+        self.asset_supply = compute_asset_supply(category_coefficients, direct, wind_speed)
+
+        for trajectory in [self.scheduled_demand, self.generation_schedule, self.realised_demand,
+                           self.excess_generation, self.day_ahead_demand, self.day_ahead_supply,
+                           *self.asset_supply.values()]:
+            trajectory.flags.writeable = False
+
+    def get_trajectory_indexes(self, profiles, category_coefficients):
+        """
+        Returns the trajectory of every member of a community.
+        :param profiles: list: demand column, member type and generation coefficients of every member
+        :param category_coefficients: Dict: solar and wind coefficients of every asset category
+        :return: ndarray: index of the trajectory of every member
+        """
+        same_assets = category_coefficients.keys() == self.category_coefficients.keys() and all(
+            np.array_equal(coefficients, self.category_coefficients[asset_category])
+            for asset_category, coefficients in category_coefficients.items())
+        if not same_assets or not set(profiles) <= set(self.profiles):
+            raise ValueError('The trajectories were precomputed for a different community configuration')
+        return np.array([self.profiles.index(profile) for profile in profiles], dtype=int)
+
+
+def precompute_trajectories(agents_list):
+    """
+    Precomputes the lever-invariant trajectories of a community configuration.
+    :param agents_list: list: community configuration
+    :return: CommunityTrajectories: trajectories for every day of the input data
+    """
+    model = EnergyCommunity(agents_list=agents_list, engine=EngineType.ARRAY)
+    profiles = list(dict.fromkeys(model.engine.get_member_profiles()))
+    return CommunityTrajectories(profiles, model.engine.category_coefficients)
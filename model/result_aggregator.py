@@ -0,0 +1,297 @@
+"""
+This module contains the online aggregation of experiment results over replications.
+"""
+
+import math
+from statistics import NormalDist
+
+from model.result_stream import *
+
+# Household types of the residential members
+RESIDENTIAL_TYPES = ['hh1', 'hh2', 'hh3']
+# Asset category of the generation reported in M4_total
+SOLAR_CATEGORY = "<class 'model.agents.Solar'>"
+# Key metrics summed over the days of a year in the annual summary
+SUM_COLUMNS = ['M1_total_residential', 'M1_total_non_residential', 'M1_total',
+               'M2_total_residential', 'M2_total_non_residential', 'M2_total',
+               'M3_total_residential', 'M3_total_non_residential', 'M3_total',
+               'M4_total',
+               'M5_total_residential', 'M5_total_non_residential', 'M5_total',
+               'M6_total_residential', 'M6_total_non_residential', 'M6_total', ]
+# Key metrics averaged over the days of a year in the annual summary
+MEAN_COLUMNS = ['M1_mean_residential',
+                'M2_mean_residential',
+                'M3_mean_residential',
+                'M5_mean_residential',
+                'M6_mean_residential', ]
+# Statistics over the replications reported for every day and key metric
+STATISTICS = ['mean', 'std', 'min', 'max']
+
+
+class RunningStatistics:
+    """
+    Running mean, variance, minimum and maximum of arrays added one at a time. The variance is updated with Welford's
+    algorithm, so the added arrays do not have to be kept.
+    """
+
+    def __init__(self, shape):
+        """
+        :param shape: tuple: shape of the added arrays
+        """
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.sum_of_squares = np.zeros(shape)  # Sum of squared differences from the mean
+        self.minimum = np.full(shape, np.inf)
+        self.maximum = np.full(shape, -np.inf)
+
+    def add(self, values):
+        """
+        Adds an array to the statistics.
+        :param values: ndarray: values with the shape of the statistics
+        """
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.sum_of_squares += delta * (values - self.mean)
+        np.minimum(self.minimum, values, out=self.minimum)
+        np.maximum(self.maximum, values, out=self.maximum)
+
+    def get_variance(self):
+        """
+        Returns the sample variance of the added arrays.
+        :return: ndarray: variance, nan if fewer than two arrays were added
+        """
+        if self.count < 2:
+            return np.full(self.mean.shape, np.nan)
+        return self.sum_of_squares / (self.count - 1)
+
+
+class ResultAggregator:
+    """
+    Aggregates the daily key metrics of experiment conditions over their replications while the experiment runs. A
+    replication is reduced to its key metrics and added to the running statistics of its condition per day and key
+    metric, so the annual summary of aggregate_timeseries_data is available without keeping the raw daily results.
+    """
+
+    def __init__(self, experiment_setup=None):
+        """
+        :param experiment_setup: DataFrame: levers and uncertainties of every experiment condition
+        """
+        self.experiment_setup = experiment_setup
+        self.statistics = {}
+        self.dates = {}
+        self.annual_totals = {}
+        self.columns = None
+
+    def add_replication(self, condition_index, results, replication=None):
+        """
+        Adds the results of a replication to the statistics of its experiment condition.
+        :param condition_index: int: index of the experiment condition
+        :param results: DataFrame: results with (metric, member) columns, or the directory they were streamed to
+        :param replication: int: index of the replication, defaults to the number of replications added before
+        """
+        if isinstance(results, str):
+            results = load_result_stream(results).to_dataframe()
+        key_metrics = get_key_metrics(results)
+        if condition_index not in self.statistics:
+            self.statistics[condition_index] = RunningStatistics(key_metrics.shape)
+            self.dates[condition_index] = results['date'].to_numpy().ravel()
+            self.annual_totals[condition_index] = {}
+            self.columns = key_metrics.columns
+        if replication is None:
+            replication = self.get_replication_count(condition_index)
+        self.statistics[condition_index].add(key_metrics.to_numpy())
+        self.annual_totals[condition_index][replication] = key_metrics.sum().to_numpy()
+
+    def get_annual_totals(self, condition_index):
+        """
+        Returns the key metrics of every replication of an experiment condition, summed over the steps.
+        :param condition_index: int: index of the experiment condition
+        :return: DataFrame: one row per replication, in replication order
+        """
+        return pd.DataFrame.from_dict(self.annual_totals[condition_index], orient='index',
+                                      columns=self.columns).sort_index()
+
+    def get_replication_count(self, condition_index):
+        """
+        Returns the number of replications added for an experiment condition.
+        :param condition_index: int: index of the experiment condition
+        :return: int: number of replications
+        """
+        if condition_index not in self.statistics:
+            return 0
+        return self.statistics[condition_index].count
+
+    def get_daily_statistics(self, condition_index):
+        """
+        Returns the statistics of every day and key metric of an experiment condition over its replications.
+        :param condition_index: int: index of the experiment condition
+        :return: DataFrame: one row per step with (key metric, statistic) columns
+        """
+        statistics = self.statistics[condition_index]
+        values = {'mean': statistics.mean, 'std': np.sqrt(statistics.get_variance()), 'min': statistics.minimum,
+                  'max': statistics.maximum}
+        frames = {statistic: pd.DataFrame(values[statistic], columns=self.columns) for statistic in STATISTICS}
+        daily_statistics = pd.concat(frames, axis=1).swaplevel(axis=1)
+        daily_statistics = daily_statistics[self.columns]
+        daily_statistics.index = pd.Index(self.dates[condition_index], name='date')
+        return daily_statistics
+
+    def get_annual_summary(self):
+        """
+        Returns the annual summary of every experiment condition, like aggregate_timeseries_data. Daily key metrics
+        are averaged over the replications, and then summed or averaged over the days.
+        :return: DataFrame: one row per experiment condition
+        """
+        summary = {}
+        for condition_index in sorted(self.statistics.keys()):
+            mean_values = pd.DataFrame(self.statistics[condition_index].mean, columns=self.columns)
+            summary[condition_index] = {**mean_values[SUM_COLUMNS].sum().to_dict(),
+                                        **mean_values[MEAN_COLUMNS].mean().to_dict(),
+                                        'experiment_setup': condition_index}
+            if self.experiment_setup is not None:
+                summary[condition_index] |= self.experiment_setup.loc[condition_index].to_dict()
+            summary[condition_index]['replications'] = self.get_replication_count(condition_index)
+        return pd.DataFrame.from_dict(summary, orient='index')
+
+    def save_annual_summary(self, path):
+        """
+        Saves the annual summary of every experiment condition in a csv file.
+        :param path: string: path of the csv file
+        """
+        self.get_annual_summary().to_csv(path)
+
+
+class ConfidenceIntervalRule:
+    """
+    Stopping rule for adaptive replications. An experiment condition is complete once the confidence interval of the
+    mean of every KPI over its replications has a half-width of at most a share of that mean, or once the maximum
+    number of replications is reached. KPIs are key metrics summed over the steps of a replication, e.g. the annual
+    shifted load 'M3_total' and energy costs 'M6_total'. A KPI without variation is complete after the minimum
+    number of replications.
+    """
+
+    def __init__(self, kpis=('M3_total', 'M6_total'), relative_half_width=0.05, confidence=0.95, min_replications=3,
+                 max_replications=30):
+        """
+        :param kpis: tuple: key metrics the confidence intervals are computed for
+        :param relative_half_width: float: maximum half-width of a confidence interval as a share of its mean
+        :param confidence: float: confidence level of the intervals
+        :param min_replications: int: number of replications before the intervals are checked, at least two
+        :param max_replications: int: number of replications after which a condition is complete
+        """
+        if min_replications < 2:
+            raise ValueError('A confidence interval requires at least two replications')
+        if max_replications < min_replications:
+            raise ValueError('The maximum number of replications is below the minimum')
+        self.kpis = list(kpis)
+        self.relative_half_width = relative_half_width
+        self.confidence = confidence
+        self.min_replications = min_replications
+        self.max_replications = max_replications
+
+    def get_half_widths(self, annual_totals):
+        """
+        Returns the half-width of the confidence interval of the mean of every KPI.
+        :param annual_totals: DataFrame: key metrics of every replication, summed over the steps
+        :return: Series: half-width of every KPI
+        """
+        values = annual_totals[self.kpis]
+        return get_t_quantile(self.confidence, len(values) - 1) * values.std(ddof=1) / np.sqrt(len(values))
+
+    def is_complete(self, annual_totals):
+        """
+        Returns whether an experiment condition needs no further replications.
+        :param annual_totals: DataFrame: key metrics of every replication, summed over the steps
+        :return: Boolean: True if the maximum is reached or all confidence intervals are narrow enough
+        """
+        if len(annual_totals) < self.min_replications:
+            return False
+        if len(annual_totals) >= self.max_replications:
+            return True
+        means = annual_totals[self.kpis].mean()
+        return bool((self.get_half_widths(annual_totals) <= self.relative_half_width * means.abs()).all())
+
+
+def get_t_quantile(confidence, degrees_of_freedom):
+    """
+    Returns the two-sided quantile of the Student t-distribution. It is exact for one and two degrees of freedom and
+    uses the Cornish-Fisher expansion of the normal quantile otherwise (Abramowitz and Stegun 26.7.5), which is within
+    0.2% of the 95% quantile from three degrees of freedom.
+    :param confidence: float: confidence level, e.g. 0.95
+    :param degrees_of_freedom: int: degrees of freedom, at least one
+    :return: float: quantile
+    """
+    probability = 1 - (1 - confidence) / 2
+    if degrees_of_freedom == 1:
+        return math.tan(math.pi * (probability - 0.5))
+    if degrees_of_freedom == 2:
+        return (2 * probability - 1) / math.sqrt(2 * probability * (1 - probability))
+    z = NormalDist().inv_cdf(probability)
+    terms = [(z ** 3 + z) / 4,
+             (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96,
+             (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384,
+             (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160]
+    return z + sum(term / degrees_of_freedom ** power for power, term in enumerate(terms, start=1))
+
+
+def get_member_groups(members):
+    """
+    Returns masks of the residential and non-residential members and of every household type.
+    :param members: list: names of the members
+    :return: Dict: boolean mask of the members in every group
+    """
+    names = pd.Index(members).str.lower()
+    groups = {'residential': names.str.startswith('hh')}
+    groups['non_residential'] = ~groups['residential']
+    for residential_type in RESIDENTIAL_TYPES:
+        groups[residential_type] = names.str.startswith(residential_type)
+    return groups
+
+
+def get_member_key_metrics(values, members, metric):
+    """
+    Reduces the values of a member metric to its total, residential and non-residential key metrics. Members without
+    a value in a row are left out of its totals, means and standard deviations.
+    :param values: ndarray: (rows x members) values of the metric, nan for missing members
+    :param members: list: names of the members
+    :param metric: string: name of the metric
+    :return: Dict: array of every key metric
+    """
+    groups = get_member_groups(members)
+    residential = values[:, groups['residential']]
+    name = metric[:2]
+    key_metrics = {f"{name}_total": np.nansum(values, axis=1),
+                   f"{name}_total_residential": np.nansum(residential, axis=1),
+                   f"{name}_mean_residential": reduce_group(np.nanmean, residential),
+                   f"{name}_std_residential": reduce_group(np.nanstd, residential),
+                   f"{name}_total_non_residential": np.nansum(values[:, groups['non_residential']], axis=1)}
+    for residential_type in RESIDENTIAL_TYPES:
+        key_metrics[f"{name}_mean_{residential_type}"] = reduce_group(np.nanmean, values[:, groups[residential_type]])
+    return key_metrics
+
+
+def reduce_group(function, values):
+    """
+    Reduces every row of the values of a group of members.
+    :param function: function: NumPy reduction ignoring nan
+    :param values: ndarray: (rows x members) values of the members of the group
+    :return: ndarray: reduced value of every row, nan for groups without members
+    """
+    if values.shape[1] == 0:
+        return np.full(len(values), np.nan)
+    return function(values, axis=1)
+
+
+def get_key_metrics(results):
+    """
+    Returns the key metrics of every step of results with (metric, member) columns.
+    :param results: DataFrame: results of the result store
+    :return: DataFrame: key metrics with the index of the results
+    """
+    key_metrics = {}
+    for metric in MEMBER_METRICS:
+        key_metrics |= get_member_key_metrics(results[metric].to_numpy(dtype=float), results[metric].columns.to_list(),
+                                              metric)
+    key_metrics["M4_total"] = results[(GENERATION_METRIC, SOLAR_CATEGORY)].to_numpy(dtype=float)
+    return pd.DataFrame(key_metrics, index=results.index)
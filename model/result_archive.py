@@ -0,0 +1,189 @@
+"""
+This module contains the partitioned columnar archive of experiment results.
+"""
+
+import json
+import operator
+import os
+import tempfile
+
+from model.result_store import *
+
+MANIFEST_FILE = 'manifest.json'
+ARCHIVE_VERSION = 1
+# Columns of the member and asset category metrics, stored as one (steps x members) or (steps x asset categories) array
+MATRIX_COLUMNS = {metric: 'members' for metric in MEMBER_METRICS} | {GENERATION_METRIC: 'asset_categories'}
+# Fields of the manifest that filters can select partitions by, the levers and uncertainties are added per partition
+PARTITION_FIELDS = ['community', 'condition', 'replication']
+FILTER_OPERATORS = {'==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt,
+                    '>=': operator.ge, 'in': np.isin}
+
+
+class ResultArchive:
+    """
+    Archive of experiment results partitioned by community, experiment condition and replication. Every replication is
+    a compressed .npz file with one array per column, so columns are read independently of each other. Metrics are
+    stored as float32. A manifest records the schema of the columns and the levers, uncertainties and seed of every
+    partition, so partitions can be selected without opening them.
+    """
+
+    def __init__(self, folder):
+        """
+        Open an archive, or create an empty one.
+        :param folder: string: root folder of the archive
+        """
+        self.folder = folder
+        self.manifest_path = os.path.join(folder, MANIFEST_FILE)
+        self.manifest = {'version': ARCHIVE_VERSION, 'schema': None, 'partitions': []}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as file:
+                self.manifest = json.load(file)
+
+    def write_replication(self, results, community, condition_index, replication, parameters=None,
+                          seed_sequence=None):
+        """
+        Writes the results of a replication to its partition. The manifest is updated by save_manifest.
+        :param results: DataFrame: results with (metric, member) columns, as returned with the result store
+        :param community: string: name of the community
+        :param condition_index: int: index of the experiment condition
+        :param replication: int: index of the replication
+        :param parameters: Dict: values of the levers and uncertainties of the experiment condition
+        :param seed_sequence: SeedSequence: seed of the random stream of the replication
+        """
+        path = os.path.join(str(community), f'condition_{condition_index}', f'replication_{replication}.npz')
+        columns = {'date': results['date'].to_numpy(dtype=str).ravel()}
+        for metric, labels in MATRIX_COLUMNS.items():
+            columns[metric] = results[metric].to_numpy(dtype=np.float32)
+            columns[labels] = results[metric].columns.to_numpy(dtype=str)
+        for metric in COMMUNITY_METRICS:
+            columns[metric] = results[metric].to_numpy(dtype=np.float32).ravel()
+        self.write_columns(path, columns)
+
+        if self.manifest['schema'] is None:
+            self.manifest['schema'] = {column: str(values.dtype) for column, values in columns.items()}
+        partition = {'community': str(community), 'condition': int(condition_index), 'replication': int(replication),
+                     'path': path, 'steps': len(results), 'parameters': convert_parameters(parameters)}
+        if seed_sequence is not None:
+            partition['seed'] = {'entropy': seed_sequence.entropy, 'spawn_key': list(seed_sequence.spawn_key)}
+        self.manifest['partitions'] = [entry for entry in self.manifest['partitions'] if entry['path'] != path]
+        self.manifest['partitions'].append(partition)
+
+    def write_columns(self, path, columns):
+        """
+        Writes the columns of a partition to a compressed .npz file, through a temporary file so a partition is either
+        complete or missing.
+        :param path: string: path of the partition relative to the root folder
+        :param columns: Dict: array of every column
+        """
+        path = os.path.join(self.folder, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Column names are stored as a list, since they are not valid names of arrays in the .npz file
+        arrays = {f'column_{position}': values for position, values in enumerate(columns.values())}
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as file:
+            np.savez_compressed(file, columns=np.array(list(columns.keys())), **arrays)
+        os.replace(temporary_path, path)
+
+    def save_manifest(self):
+        """Writes the manifest of the archive."""
+        os.makedirs(self.folder, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        with os.fdopen(descriptor, 'w') as file:
+            json.dump(self.manifest, file, indent=1)
+        os.replace(temporary_path, self.manifest_path)
+
+    def get_partitions(self, filters=None):
+        """
+        Returns the partitions selected by the filters on the manifest fields.
+        :param filters: list: (field, operator, value) filters on the community, condition, replication, levers and
+        uncertainties. Filters on other fields are ignored.
+        :return: list: manifest entries of the selected partitions
+        """
+        partitions = []
+        for partition in self.manifest['partitions']:
+            fields = get_partition_fields(partition)
+            if all(FILTER_OPERATORS[condition](fields[field], value) for field, condition, value in filters or [] if
+                   field in fields):
+                partitions.append(partition)
+        return partitions
+
+    def read(self, columns=None, filters=None):
+        """
+        Reads the results of the selected partitions into one DataFrame. Only the requested columns are decompressed.
+        :param columns: list: names of the metric columns to read, all columns if None. The date is always read.
+        :param filters: list: (field, operator, value) filters. Filters on the community, condition, replication,
+        levers and uncertainties select partitions, filters on the date or the community metrics select rows.
+        :return: DataFrame: results of all selected partitions with (metric, member) columns, in the order of the
+        manifest, preceded by the community, condition, replication, levers and uncertainties of every row
+        """
+        if columns is None:
+            columns = list(MATRIX_COLUMNS.keys()) + COMMUNITY_METRICS
+        unknown_columns = set(columns) - set(MATRIX_COLUMNS.keys()) - set(COMMUNITY_METRICS)
+        if unknown_columns:
+            raise KeyError(f'Unknown result columns: {sorted(unknown_columns)}')
+        row_filters = [(field, condition, value) for field, condition, value in filters or [] if
+                       field == 'date' or field in COMMUNITY_METRICS]
+
+        frames = []
+        for partition in self.get_partitions(filters):
+            data = self.read_partition(partition, set(columns) | {field for field, _, _ in row_filters})
+            rows = np.ones(partition['steps'], dtype=bool)
+            for field, condition, value in row_filters:
+                rows &= FILTER_OPERATORS[condition](data[field], value)
+
+            fields = get_partition_fields(partition)
+            frame = {(field, ''): np.repeat(fields[field], rows.sum()) for field in fields}
+            frame[('date', '')] = data['date'][rows]
+            for column in columns:
+                if column in MATRIX_COLUMNS:
+                    for label, values in zip(data[MATRIX_COLUMNS[column]], data[column][rows].T):
+                        frame[(column, label)] = values
+                else:
+                    frame[(column, '')] = data[column][rows]
+            frames.append(pd.DataFrame(frame))
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def read_partition(self, partition, columns):
+        """
+        Reads columns of a partition. Arrays of a .npz file are decompressed on access, so other columns are skipped.
+        :param partition: Dict: manifest entry of the partition
+        :param columns: set: names of the columns to read
+        :return: Dict: array of the date, the requested columns and their member or asset category labels
+        """
+        with np.load(os.path.join(self.folder, partition['path'])) as data:
+            positions = {column: position for position, column in enumerate(data['columns'].tolist())}
+            columns = columns | {'date'} | {MATRIX_COLUMNS[column] for column in columns if column in MATRIX_COLUMNS}
+            return {column: data[f'column_{positions[column]}'] for column in columns}
+
+
+def get_partition_fields(partition):
+    """
+    Returns the fields of a partition that filters can select by.
+    :param partition: Dict: manifest entry of the partition
+    :return: Dict: community, condition, replication, levers and uncertainties of the partition
+    """
+    return {field: partition[field] for field in PARTITION_FIELDS} | partition['parameters']
+
+
+def convert_parameters(parameters):
+    """
+    Converts the levers and uncertainties of an experiment condition into JSON values.
+    :param parameters: Dict: values of the levers and uncertainties, or None
+    :return: Dict: values as floats
+    """
+    if parameters is None:
+        return {}
+    return {name: float(value) for name, value in parameters.items()}
+
+
+def load_archive(folder, columns=None, filters=None):
+    """
+    Reads results from an archive.
+    :param folder: string: root folder of the archive
+    :param columns: list: names of the metric columns to read, all columns if None
+    :param filters: list: (field, operator, value) filters, e.g. [('L1', '==', 0.5), ('date', '>=', '2021-06-01')]
+    :return: DataFrame: results of all selected partitions
+    """
+    return ResultArchive(folder).read(columns, filters)
@@ -0,0 +1,183 @@
+"""
+This module contains the content-addressed cache of simulation results.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from enum import Enum
+
+import numpy as np
+
+from model.input_data import get_data_hash
+
+CACHE_VERSION = 1  # Version of the format of the cache entries, part of every key
+MAX_CACHE_SIZE = 2 * 1024 ** 3  # Default bound of the total size of the cache entries in bytes
+MODEL_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Hash of the source code of the model, computed on first use
+model_version = None
+
+
+class ResultCache:
+    """
+    On-disk cache of the results of simulation runs. An entry is keyed by the hash of everything that determines the
+    results: the community configuration, levers, uncertainties, seeds, number of steps, engine, collector, the input
+    data files and the source code of the model. Entries are pickled to one file each. The modification time of an
+    entry records its last use, and the least recently used entries are removed once the cache exceeds its size.
+    """
+
+    def __init__(self, directory, max_size=MAX_CACHE_SIZE):
+        """
+        :param directory: string: directory of the cache entries
+        :param max_size: int: bound of the total size of the cache entries in bytes
+        """
+        self.directory = directory
+        self.max_size = max_size
+
+    def get_key(self, agent_list, levers, uncertainties, seed_sequence, steps, engine, collector, replications=1):
+        """
+        Returns the key of the results of a simulation run.
+        :param agent_list: list: community configuration
+        :param levers: Dict: values of the policy levers
+        :param uncertainties: Dict: values of the uncertainties
+        :param seed_sequence: SeedSequence: seed of the random stream, or a list with one per batched replication
+        :param steps: int: number of steps
+        :param engine: EngineType: engine used for advancing the model
+        :param collector: CollectorType: collector of the results
+        :param replications: int: number of replications simulated together
+        :return: string: SHA-256 hex digest, None if the run has no seed and its results are not reproducible
+        """
+        seed_sequences = seed_sequence if isinstance(seed_sequence, list) else [seed_sequence]
+        if any(sequence is None for sequence in seed_sequences):
+            return None
+        content = {'version': CACHE_VERSION, 'model': get_model_version(), 'data': get_data_hash(),
+                   'agent_list': agent_list, 'levers': levers, 'uncertainties': uncertainties,
+                   'seeds': [[str(sequence.entropy), list(sequence.spawn_key)] for sequence in seed_sequences],
+                   'steps': steps, 'engine': engine, 'collector': collector, 'replications': replications}
+        text = json.dumps(content, sort_keys=True, default=convert_value)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get_path(self, key):
+        """
+        Returns the path of a cache entry.
+        :param key: string: key of the entry
+        :return: string: path of the entry
+        """
+        return os.path.join(self.directory, f'{key}.pkl')
+
+    def load(self, key):
+        """
+        Returns the cached results of a key and marks the entry as used.
+        :param key: string: key of the entry
+        :return: results of the simulation run, None if they are not cached
+        """
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as file:
+                results = pickle.load(file)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (EOFError, pickle.UnpicklingError):
+            # Entries are written through a temporary file, so a damaged entry is dropped and simulated again
+            remove_entry(path)
+            return None
+        return results
+
+    def store(self, key, results):
+        """
+        Stores the results of a simulation run, and removes the least recently used entries if the cache exceeds its
+        size. Results are still returned by the simulation if the entry cannot be written.
+        :param key: string: key of the entry
+        :param results: results of the simulation run
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(descriptor, 'wb') as file:
+                    pickle.dump(results, file, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temporary_path, self.get_path(key))
+            finally:
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits its size, keeping at least the newest entry."""
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, '*.pkl')):
+            try:
+                status = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((status.st_mtime, status.st_size, path))
+        entries.sort()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries[:-1]:
+            if total_size <= self.max_size:
+                break
+            remove_entry(path)
+            total_size -= size
+
+    def get_size(self):
+        """
+        Returns the total size of the cache entries.
+        :return: int: size in bytes
+        """
+        return sum(os.path.getsize(path) for path in glob.glob(os.path.join(self.directory, '*.pkl')))
+
+    def clear(self):
+        """Removes all cache entries."""
+        for path in glob.glob(os.path.join(self.directory, '*.pkl')):
+            remove_entry(path)
+
+
+def get_model_version():
+    """
+    Returns the hash of the source code of the model, so cached results are not reused after the model changes.
+    :return: string: hash of the content of the modules of the model
+    """
+    global model_version
+    if model_version is None:
+        source_hash = hashlib.sha256()
+        for path in sorted(glob.glob(os.path.join(MODEL_DIRECTORY, '*.py'))):
+            source_hash.update(os.path.basename(path).encode())
+            with open(path, 'rb') as file:
+                source_hash.update(file.read())
+        model_version = source_hash.hexdigest()[:16]
+    return model_version
+
+
+def convert_value(value):
+    """
+    Converts the values of a community configuration and run parameters that json cannot encode.
+    :param value: Enum, class or NumPy value
+    :return: JSON value
+    """
+    if isinstance(value, Enum):
+        return f'{type(value).__name__}.{value.name}'
+    if isinstance(value, type):
+        return f'{value.__module__}.{value.__qualname__}'
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return repr(value)
+
+
+def remove_entry(path):
+    """
+    Removes a cache entry, if no other process removed it first.
+    :param path: string: path of the entry
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
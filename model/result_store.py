@@ -0,0 +1,121 @@
+"""
+This module contains the typed result store of the model.
+"""
+
+from model.data_reporters import *
+
+
+class ResultStore:
+    """
+    Collects the model outputs straight into preallocated (steps x members x metrics), (steps x asset categories) and
+    (steps x community metrics) arrays, next to the index of community members. Results are exported without string
+    serialization.
+    """
+
+    def __init__(self, member_keys, asset_categories, steps=0, member_counts=None):
+        """
+        Initialize the result arrays.
+        :param member_keys: list: reporter key of every community member
+        :param asset_categories: list: name of every asset category
+        :param steps: int: number of steps to preallocate
+        :param member_counts: ndarray: number of households of every community member, 1 for each if None
+        """
+        self.member_index = pd.Index(member_keys, name='member')
+        self.member_counts = np.ones(len(self.member_index), dtype=int)
+        if member_counts is not None:
+            self.member_counts = np.asarray(member_counts, dtype=int)
+        self.asset_categories = pd.Index(asset_categories, name='asset_category')
+        self.dates = np.empty(0, dtype='U10')
+        self.member_values = np.empty((0, len(self.member_index), len(MEMBER_METRICS)))
+        self.generation = np.empty((0, len(self.asset_categories)))
+        self.community_values = np.empty((0, len(COMMUNITY_METRICS)))
+        self.steps_collected = 0
+        self.reserve(steps)
+
+    def reserve(self, steps):
+        """
+        Grows the result arrays to hold at least a number of steps.
+        :param steps: int: number of steps
+        """
+        missing_steps = steps - len(self.dates)
+        if missing_steps > 0:
+            self.dates = np.concatenate([self.dates, np.empty(missing_steps, dtype='U10')])
+            self.member_values = np.concatenate(
+                [self.member_values, np.full((missing_steps,) + self.member_values.shape[1:], np.nan)])
+            self.generation = np.concatenate(
+                [self.generation, np.full((missing_steps,) + self.generation.shape[1:], np.nan)])
+            self.community_values = np.concatenate(
+                [self.community_values, np.full((missing_steps,) + self.community_values.shape[1:], np.nan)])
+
+    def collect(self, model):
+        """
+        Writes the outputs of the current step of a model into the result arrays.
+        :param model: EnergyCommunity: model to collect the outputs from
+        """
+        step = self.steps_collected
+        self.reserve(step + 1)
+        self.dates[step] = get_date(model)
+        self.member_values[step] = get_member_metrics(model)
+        self.generation[step] = get_generation_values(model)
+        self.community_values[step] = get_community_values(model)
+        self.steps_collected += 1
+
+    def to_dataframe(self, per_household=False):
+        """
+        Returns the collected results with one row per step, like the DataCollector, and one column per metric and
+        member or asset category.
+        :param per_household: Boolean: whether member metrics of cohort agents are divided by their member count
+        :return: DataFrame: results with (metric, member) columns
+        """
+        steps = self.steps_collected
+        member_values = self.member_values[:steps]
+        if per_household:
+            member_values = member_values / self.member_counts[:, np.newaxis]
+        frames = {'date': pd.DataFrame({'': self.dates[:steps]})}
+        for position, metric in enumerate(MEMBER_METRICS):
+            frames[metric] = pd.DataFrame(member_values[:, :, position], columns=self.member_index)
+        frames[GENERATION_METRIC] = pd.DataFrame(self.generation[:steps], columns=self.asset_categories)
+        for position, metric in enumerate(COMMUNITY_METRICS):
+            frames[metric] = pd.DataFrame({'': self.community_values[:steps, position]})
+        columns = ['date'] + sorted(MEMBER_METRICS + [GENERATION_METRIC]) + COMMUNITY_METRICS
+        return pd.concat([frames[column] for column in columns], axis=1, keys=columns)
+
+    def save(self, path):
+        """
+        Saves the collected results in a compressed binary file.
+        :param path: string or file: path of the .npz file, or a file opened for binary writing
+        """
+        steps = self.steps_collected
+        np.savez_compressed(path, dates=self.dates[:steps], member_index=self.member_index.to_numpy(dtype=str),
+                            member_counts=self.member_counts, metrics=np.array(MEMBER_METRICS),
+                            asset_categories=self.asset_categories.to_numpy(dtype=str),
+                            member_values=self.member_values[:steps], generation=self.generation[:steps],
+                            community_values=self.community_values[:steps])
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads results saved by ResultStore.save.
+        :param path: string: path of the .npz file
+        :return: ResultStore: store holding the saved results
+        """
+        with np.load(path) as data:
+            store = cls(data['member_index'].tolist(), data['asset_categories'].tolist(),
+                        member_counts=data['member_counts'] if 'member_counts' in data else None)
+            store.dates = data['dates']
+            store.member_values = data['member_values']
+            store.generation = data['generation']
+            store.community_values = data['community_values']
+        store.steps_collected = len(store.dates)
+        return store
+
+
+def create_result_store(model, steps=0):
+    """
+    Creates a result store for the community members and asset categories of a model.
+    :param model: EnergyCommunity: model whose outputs are collected
+    :param steps: int: number of steps to preallocate
+    :return: ResultStore: empty result store
+    """
+    asset_categories = [str(asset_category) for asset_category in model.all_assets.keys()]
+    return ResultStore(get_member_keys(model), asset_categories, steps, get_member_counts(model))
@@ -0,0 +1,168 @@
+"""
+This module contains the streaming results writer of the model.
+"""
+
+import glob
+import os
+import queue
+import threading
+
+from model.result_store import *
+
+CHUNK_SIZE = 30  # Number of steps collected in memory before they are written to disk
+MAX_PENDING_CHUNKS = 2  # Number of full chunks that may wait for the writer thread before the simulation waits
+
+
+class ResultStream:
+    """
+    Streams the model outputs to disk in chunks with a fixed number of steps. A chunk is collected into a ResultStore,
+    and full chunks are handed to a background thread that writes them to numbered .npz files while the simulation
+    continues in a new chunk. Memory stays bounded by the chunk size whatever the number of steps.
+    """
+
+    def __init__(self, directory, member_keys, asset_categories, member_counts=None, chunk_size=CHUNK_SIZE,
+                 max_pending_chunks=MAX_PENDING_CHUNKS):
+        """
+        Initialize the stream. Chunks left in the directory by an earlier run are removed.
+        :param directory: string: directory the chunks are written to
+        :param member_keys: list: reporter key of every community member
+        :param asset_categories: list: name of every asset category
+        :param member_counts: ndarray: number of households of every community member, 1 for each if None
+        :param chunk_size: int: number of steps per chunk
+        :param max_pending_chunks: int: number of full chunks that may wait for the writer thread
+        """
+        self.directory = directory
+        self.member_keys = member_keys
+        self.asset_categories = asset_categories
+        self.member_counts = member_counts
+        self.chunk_size = chunk_size
+        os.makedirs(directory, exist_ok=True)
+        for path in get_chunk_paths(directory):
+            os.remove(path)
+        self.chunk = self.create_chunk()
+        self.chunks_written = 0
+        self.steps_collected = 0
+        self.pending_chunks = queue.Queue(maxsize=max_pending_chunks)
+        self.writer = None
+        self.error = None
+
+    def create_chunk(self):
+        """
+        Returns an empty chunk.
+        :return: ResultStore: result store preallocated for one chunk
+        """
+        return ResultStore(self.member_keys, self.asset_categories, self.chunk_size, self.member_counts)
+
+    def collect(self, model):
+        """
+        Writes the outputs of the current step of a model into the current chunk, and hands the chunk to the writer
+        thread once it is full.
+        :param model: EnergyCommunity: model to collect the outputs from
+        """
+        self.check_writer()
+        self.chunk.collect(model)
+        self.steps_collected += 1
+        if self.chunk.steps_collected == self.chunk_size:
+            self.write_chunk()
+
+    def write_chunk(self):
+        """Hands the current chunk to the writer thread and starts a new chunk."""
+        if self.chunk.steps_collected == 0:
+            return
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.write_pending_chunks, daemon=True)
+            self.writer.start()
+        path = os.path.join(self.directory, f'chunk_{self.chunks_written:05d}.npz')
+        # Blocks only when the writer thread falls behind by more than the maximum number of pending chunks
+        self.pending_chunks.put((self.chunk, path))
+        self.chunks_written += 1
+        self.chunk = self.create_chunk()
+
+    def write_pending_chunks(self):
+        """Writes chunks until the stream is flushed. Runs in the writer thread."""
+        while True:
+            pending_chunk = self.pending_chunks.get()
+            if pending_chunk is None:
+                return
+            chunk, path = pending_chunk
+            try:
+                # Written to a temporary file first, so a chunk file is either complete or missing
+                temporary_path = path + '.tmp'
+                with open(temporary_path, 'wb') as file:
+                    chunk.save(file)
+                os.replace(temporary_path, path)
+            except Exception as error:
+                self.error = error
+
+    def flush(self):
+        """Writes the current chunk and waits until all chunks are on disk. Collection can continue afterwards."""
+        self.write_chunk()
+        if self.writer is not None:
+            self.pending_chunks.put(None)
+            self.writer.join()
+            self.writer = None
+        self.check_writer()
+
+    def check_writer(self):
+        """Raises the error of the writer thread, if writing a chunk failed."""
+        if self.error is not None:
+            raise IOError(f'Writing results to {self.directory} failed') from self.error
+
+    def to_dataframe(self, per_household=False):
+        """
+        Writes all outputs and loads them back as one DataFrame, like the ResultStore.
+        :param per_household: Boolean: whether member metrics of cohort agents are divided by their member count
+        :return: DataFrame: results with (metric, member) columns
+        """
+        self.flush()
+        return load_result_stream(self.directory).to_dataframe(per_household)
+
+
+def get_chunk_paths(directory):
+    """
+    Returns the chunk files of a stream in the order they were written.
+    :param directory: string: directory of the stream
+    :return: list: paths of the chunk files
+    """
+    return sorted(glob.glob(os.path.join(directory, 'chunk_*.npz')))
+
+
+def iter_result_chunks(directory):
+    """
+    Yields the chunks of a stream one by one, so results can be processed with bounded memory.
+    :param directory: string: directory of the stream
+    :return: generator: ResultStore of every chunk
+    """
+    for path in get_chunk_paths(directory):
+        yield ResultStore.load(path)
+
+
+def load_result_stream(directory):
+    """
+    Loads all chunks of a stream into one result store.
+    :param directory: string: directory of the stream
+    :return: ResultStore: store holding all streamed results
+    """
+    chunks = list(iter_result_chunks(directory))
+    if not chunks:
+        raise FileNotFoundError(f'No results were streamed to {directory}')
+    store = ResultStore(chunks[0].member_index.tolist(), chunks[0].asset_categories.tolist(),
+                        member_counts=chunks[0].member_counts)
+    store.dates = np.concatenate([chunk.dates for chunk in chunks])
+    store.member_values = np.concatenate([chunk.member_values for chunk in chunks])
+    store.generation = np.concatenate([chunk.generation for chunk in chunks])
+    store.community_values = np.concatenate([chunk.community_values for chunk in chunks])
+    store.steps_collected = len(store.dates)
+    return store
+
+
+def create_result_stream(model, directory, chunk_size=CHUNK_SIZE):
+    """
+    Creates a result stream for the community members and asset categories of a model.
+    :param model: EnergyCommunity: model whose outputs are collected
+    :param directory: string: directory the chunks are written to
+    :param chunk_size: int: number of steps per chunk
+    :return: ResultStream: empty result stream
+    """
+    asset_categories = [str(asset_category) for asset_category in model.all_assets.keys()]
+    return ResultStream(directory, get_member_keys(model), asset_categories, get_member_counts(model), chunk_size)
@@ -0,0 +1,73 @@
+"""
+This module contains the phase-staged scheduler of the model.
+"""
+
+from mesa.time import BaseScheduler
+
+from model.agents import *
+
+
+class PhasedScheduler(BaseScheduler):
+    """
+    Scheduler that keeps the agents in one bucket per phase and runs the phases of a step in a fixed order: assets,
+    members, coordinator and collection of the outputs. Each phase is one call over its whole bucket, so assets are
+    advanced together and the coordinator always releases the ToD windows of tomorrow after all members have used the
+    windows of today. Agents are still listed in the order they were added, like the BaseScheduler.
+    """
+
+    def __init__(self, model):
+        """
+        Create a new, empty scheduler.
+        :param model: EnergyCommunity: model whose agents are scheduled
+        """
+        super().__init__(model)
+        self.buckets = {Phase.ASSETS: [], Phase.MEMBERS: [], Phase.COORDINATOR: []}
+        self.phase_steps = {Phase.ASSETS: Asset.step_bucket,
+                            Phase.MEMBERS: Member.step_bucket,
+                            Phase.COORDINATOR: Coordinator.step_bucket}
+
+    def add(self, agent):
+        """
+        Add an agent to the schedule and to the bucket of its phase.
+        :param agent: Agent: member, asset or coordinator
+        """
+        super().add(agent)
+        self.buckets[get_phase(agent)].append(agent)
+
+    def remove(self, agent):
+        """
+        Remove an agent from the schedule and from the bucket of its phase.
+        :param agent: Agent: member, asset or coordinator
+        """
+        super().remove(agent)
+        self.buckets[get_phase(agent)].remove(agent)
+
+    def step(self):
+        """Run all phases of a step."""
+        for phase in Phase:
+            self.run_phase(phase)
+        self.steps += 1
+        self.time += 1
+
+    def run_phase(self, phase):
+        """
+        Run one phase of a step over the agents of its bucket.
+        :param phase: Phase: phase to run
+        """
+        if phase is Phase.COLLECTION:
+            self.model.collect()
+        elif self.buckets[phase]:
+            self.phase_steps[phase](self.buckets[phase])
+
+
+def get_phase(agent):
+    """
+    Returns the phase in which an agent is stepped.
+    :param agent: Agent: member, asset or coordinator
+    :return: Phase: phase of the agent
+    """
+    if agent.agent_type is AgentType.ASSET:
+        return Phase.ASSETS
+    elif agent.agent_type is AgentType.COORDINATOR:
+        return Phase.COORDINATOR
+    return Phase.MEMBERS
@@ -0,0 +1,121 @@
+"""
+This module contains the tariff engine of the model.
+"""
+
+import numpy as np
+import pandas as pd
+
+from model.input_data import SLOTS_PER_DAY, get_input_data, get_electricity_costs
+from model.tick_calendar import MONTHS
+
+FIXED_COMPONENTS = ['Electricity Transport rate (Euro/day)', 'Fixed delivery rate (Euro/day)']
+# Component replaced by day-ahead or time-of-use prices
+DYNAMIC_COMPONENT = 'Variable delivery rate (Euro/kWh)'
+# The variable delivery rate is charged twice, as in the original cost model of the members. The second charge is a
+# surcharge at the monthly rate, so dynamic prices replacing the variable delivery rate are only charged once.
+SURCHARGE_COMPONENT = 'Monthly variable delivery rate surcharge (Euro/kWh)'
+VARIABLE_COMPONENTS = [DYNAMIC_COMPONENT, 'ODE tax (Environmental Taxes Act) (Euro/kWh)', 'Energy tax (Euro/kWh)',
+                       SURCHARGE_COMPONENT]
+
+# Monthly tariffs of the input data that has been loaded
+monthly_tariffs = {}
+
+
+class Tariff:
+    """
+    Electricity prices of every day of the input data. Fixed components are held as daily prices and variable
+    components as (day x slot) prices, so monthly tariffs and 15-minute dynamic prices are handled alike. Energy costs
+    and ToD savings of all members are computed with one matrix-vector product per day.
+    """
+
+    def __init__(self, fixed_components, variable_components):
+        """
+        Initialize the tariff from its price components.
+        :param fixed_components: Dict: daily price [Euro/day] of every fixed component, one value per day
+        :param variable_components: Dict: price [Euro/kWh] of every variable component, (days x slots) array
+        """
+        self.fixed_components = fixed_components
+        self.variable_components = variable_components
+        self.fixed_costs = sum(fixed_components[component] for component in FIXED_COMPONENTS)
+        self.rates = sum(variable_components[component] for component in VARIABLE_COMPONENTS)
+        # Shifted load is a daily amount, it is valued at the mean rate of the day. With dynamic prices, savings do not
+        # include the difference between the rates of the surplus and deficit windows the load is shifted between.
+        constant_rate = (self.rates == self.rates[:, :1]).all(axis=1)
+        self.savings_rates = np.where(constant_rate, self.rates[:, 0], self.rates.mean(axis=1))
+
+    def compute_energy_cost(self, day, realised_demand, shifted_load, member_count=1):
+        """
+        Computes the energy cost and ToD savings of members for a day. ToD savings value the shifted load at the mean
+        rate of the day, so intraday differences of dynamic prices are only reflected in the cost of the realised
+        demand.
+        :param day: int: index of the day in the input data
+        :param realised_demand: ndarray: ([replications x] members x slots) realised demand, or the 96 slots of one
+        member
+        :param shifted_load: ndarray or float: load shifted by every member
+        :param member_count: ndarray or int: number of households of every member, each paying the fixed costs
+        :return:
+            energy_cost: ndarray or float: energy cost of every member after ToD savings
+            savings_ToD: ndarray or float: ToD savings of every member
+        """
+        savings_ToD = self.savings_rates[day] * shifted_load
+        energy_cost = self.fixed_costs[day] * member_count + realised_demand @ self.rates[day] - savings_ToD
+        return energy_cost, savings_ToD
+
+    def with_dynamic_prices(self, prices, component=DYNAMIC_COMPONENT):
+        """
+        Returns a tariff in which a variable component follows day-ahead or time-of-use prices. Prices are held from
+        their timestamp until the next price, so hourly prices apply to all four slots of the hour. Slots before the
+        first price keep the original price of the component.
+        :param prices: Series: prices [Euro/kWh] indexed by timestamp
+        :param component: string: name of the variable component
+        :return: Tariff: tariff with dynamic prices
+        """
+        input_data = get_input_data()
+        index = pd.date_range(start=input_data.dates[0], periods=len(input_data.dates) * SLOTS_PER_DAY, freq='15min')
+        prices = prices[~prices.index.duplicated(keep='first')].sort_index()
+        slot_prices = prices.reindex(index, method='ffill').to_numpy(dtype=float).reshape(-1, SLOTS_PER_DAY)
+        variable_components = dict(self.variable_components)
+        variable_components[component] = np.where(np.isnan(slot_prices), variable_components[component], slot_prices)
+        return Tariff(dict(self.fixed_components), variable_components)
+
+
+def create_monthly_tariff(electricity_costs, dates):
+    """
+    Creates a tariff from monthly electricity costs.
+    :param electricity_costs: Dict: electricity costs of every month
+    :param dates: list: date of every day of the input data in format "YYYY-MM-DD"
+    :return: Tariff: monthly tariff
+    """
+    months = [MONTHS[month] for month in pd.to_datetime(dates).month - 1]
+    fixed_components = {component: np.array([electricity_costs[month][component] for month in months])
+                        for component in FIXED_COMPONENTS}
+    variable_components = {component: np.repeat(np.array([[electricity_costs[month][component]] for month in months]),
+                                                SLOTS_PER_DAY, axis=1)
+                           for component in VARIABLE_COMPONENTS if component != SURCHARGE_COMPONENT}
+    variable_components[SURCHARGE_COMPONENT] = variable_components[DYNAMIC_COMPONENT].copy()
+    return Tariff(fixed_components, variable_components)
+
+
+def get_monthly_tariff():
+    """
+    Returns the monthly tariff of the electricity costs for the input data. It is created once and shared by all
+    models.
+    :return: Tariff: monthly tariff
+    """
+    input_data = get_input_data()
+    if input_data not in monthly_tariffs:
+        monthly_tariffs[input_data] = create_monthly_tariff(get_electricity_costs(), input_data.dates)
+    return monthly_tariffs[input_data]
+
+
+def load_price_file(path, column=None):
+    """
+    Reads day-ahead or time-of-use prices from a csv file with timestamps in the first column.
+    :param path: string: path of the csv file
+    :param column: string: name of the price column [Euro/kWh], defaults to the first column after the timestamps
+    :return: Series: prices indexed by timestamp
+    """
+    prices = pd.read_csv(path, parse_dates=[0], index_col=0)
+    if column is None:
+        column = prices.columns[0]
+    return prices[column]
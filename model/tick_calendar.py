@@ -0,0 +1,87 @@
+"""
+This module contains the tick calendar of the model.
+"""
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from model.input_data import get_input_data
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+          'November', 'December']
+
+
+class TickCalendar:
+    """
+    Calendar of the model ticks. The date, day of the input data and day of the input data of tomorrow are precomputed
+    for every tick, so agents look them up by integer tick instead of parsing date strings.
+    """
+
+    def __init__(self, start_date):
+        """
+        Precompute the calendar for every tick with a day in the input data.
+        :param start_date: datetime: date of the first tick
+        """
+        input_data = get_input_data()
+        self.dates = [start_date.strftime('%Y-%m-%d')]
+        # Later ticks follow EnergyCommunity.tick_to_date, so tick 1 falls on the same day as tick 0
+        while True:
+            date = (datetime.datetime(2021, 1, 1) + datetime.timedelta(len(self.dates) - 1)).strftime('%Y-%m-%d')
+            if date not in input_data.day_index:
+                break
+            self.dates.append(date)
+        # The date after the last tick is assigned once the model has simulated it
+        self.dates.append(date)
+
+        timestamps = pd.to_datetime(self.dates)
+        tomorrow_dates = (timestamps + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        # Day of the input data of every tick and of the day after, -1 if there is no input data for the day
+        self.day_indexes = np.array([input_data.day_index.get(date, -1) for date in self.dates], dtype=int)
+        self.tomorrow_indexes = np.array([input_data.day_index.get(date, -1) for date in tomorrow_dates], dtype=int)
+        self.tomorrow_dates = tomorrow_dates.to_list()
+
+    def get_date(self, tick):
+        """
+        Returns the date of a tick.
+        :param tick: int: tick number
+        :return: string: date in format "YYYY-MM-DD"
+        """
+        return self.dates[tick]
+
+    def get_day_index(self, tick):
+        """
+        Returns the day of the input data of a tick.
+        :param tick: int: tick number
+        :return: int: index of the day in the input data
+        """
+        return self.check_day_index(self.day_indexes[tick], self.dates[tick])
+
+    def get_tomorrow_index(self, tick):
+        """
+        Returns the day of the input data after a tick.
+        :param tick: int: tick number
+        :return: int: index of the next day in the input data
+        """
+        return self.check_day_index(self.tomorrow_indexes[tick], self.tomorrow_dates[tick])
+
+    def get_slot_index(self, tick):
+        """
+        Returns the timestamps of the slots of a tick, shared by all agents.
+        :param tick: int: tick number
+        :return: DatetimeIndex: 96 timestamps of the day
+        """
+        return get_input_data().get_slot_index(self.get_day_index(tick))
+
+    @staticmethod
+    def check_day_index(day, date):
+        """
+        Raises a KeyError for days without input data, as a lookup by date would.
+        :param day: int: index of the day in the input data, -1 if missing
+        :param date: string: date in format "YYYY-MM-DD"
+        :return: int: index of the day in the input data
+        """
+        if day < 0:
+            raise KeyError(date)
+        return int(day)
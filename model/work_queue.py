@@ -0,0 +1,184 @@
+"""
+This module contains the file-based work queue of experiment conditions shared by distributed workers.
+"""
+
+import fcntl
+import json
+import os
+import socket
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+
+LOCK_FILE = 'queue.lock'
+CLAIM_DIRECTORY = 'claims'
+COMPLETED_DIRECTORY = 'completed'
+LEASE_TIME = 3600  # Seconds after the last renewal of a claim before other workers may take over its task
+
+
+class WorkQueue:
+    """
+    Queue of tasks shared by any number of workers, on one or several hosts, through a folder on a shared filesystem.
+    A worker claims the first task that is neither completed nor claimed, and writes a completion marker once it is
+    done, so a restarted experiment skips completed tasks. Claims and markers are changed while holding an exclusive
+    lock on the lock file of the queue. A claim is renewed while its task runs, and a claim that is not renewed within
+    the lease time, e.g. of a crashed worker, is taken over by the next worker.
+    """
+
+    def __init__(self, folder, tasks, lease_time=LEASE_TIME, worker_id=None):
+        """
+        :param folder: string: folder of the queue on a filesystem shared by all workers
+        :param tasks: list: identifiers of the tasks, the same for all workers
+        :param lease_time: float: seconds after the last renewal of a claim before it may be taken over
+        :param worker_id: string: identifier of the worker, defaults to the host, process and a random suffix
+        """
+        self.folder = folder
+        self.tasks = list(tasks)
+        self.lease_time = lease_time
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.lock_path = os.path.join(folder, LOCK_FILE)
+        for directory in [CLAIM_DIRECTORY, COMPLETED_DIRECTORY]:
+            os.makedirs(os.path.join(folder, directory), exist_ok=True)
+
+    @contextmanager
+    def lock(self):
+        """
+        Holds the exclusive lock of the queue. POSIX record locks are used, since they are shared with other hosts
+        on NFS.
+        :return: float: current time of the filesystem, so leases do not depend on the clocks of the hosts
+        """
+        with open(self.lock_path, 'a+') as file:
+            fcntl.lockf(file, fcntl.LOCK_EX)
+            try:
+                os.utime(self.lock_path)
+                yield os.stat(self.lock_path).st_mtime
+            finally:
+                fcntl.lockf(file, fcntl.LOCK_UN)
+
+    def get_claim_path(self, task):
+        """
+        :param task: identifier of the task
+        :return: string: path of the claim of the task
+        """
+        return os.path.join(self.folder, CLAIM_DIRECTORY, f'task_{task}.json')
+
+    def get_marker_path(self, task):
+        """
+        :param task: identifier of the task
+        :return: string: path of the completion marker of the task
+        """
+        return os.path.join(self.folder, COMPLETED_DIRECTORY, f'task_{task}.json')
+
+    def is_completed(self, task):
+        """
+        :param task: identifier of the task
+        :return: Boolean: True if the completion marker of the task exists
+        """
+        return os.path.exists(self.get_marker_path(task))
+
+    def get_remaining_tasks(self):
+        """
+        :return: list: tasks without a completion marker
+        """
+        return [task for task in self.tasks if not self.is_completed(task)]
+
+    def claim(self, skipped_tasks=()):
+        """
+        Claims the first task that is neither completed nor claimed by another worker with a valid lease.
+        :param skipped_tasks: collection: tasks the worker does not claim, e.g. because they failed before
+        :return: identifier of the claimed task, None if no task is left for the worker
+        """
+        with self.lock() as now:
+            for task in self.tasks:
+                if task in skipped_tasks or self.is_completed(task):
+                    continue
+                claim_path = self.get_claim_path(task)
+                if os.path.exists(claim_path) and now - os.stat(claim_path).st_mtime <= self.lease_time:
+                    continue
+                write_json(claim_path, {'worker': self.worker_id, 'claimed': now})
+                return task
+        return None
+
+    def renew(self, task):
+        """
+        Renews the lease of a claimed task.
+        :param task: identifier of the task
+        """
+        try:
+            os.utime(self.get_claim_path(task))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def keep_claim(self, task):
+        """
+        Renews the lease of a claimed task in a background thread while the task runs.
+        :param task: identifier of the task
+        """
+        stopped = threading.Event()
+
+        def renew_claim():
+            while not stopped.wait(self.lease_time / 4):
+                self.renew(task)
+
+        thread = threading.Thread(target=renew_claim, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    def complete(self, task, information=None):
+        """
+        Writes the completion marker of a task and removes its claim.
+        :param task: identifier of the task
+        :param information: Dict: JSON values stored in the marker, e.g. the number of replications
+        """
+        with self.lock() as now:
+            write_json(self.get_marker_path(task), {'worker': self.worker_id, 'completed': now, **(information or {})})
+            self.remove_claim(task)
+
+    def release(self, task):
+        """
+        Removes the claim of a task that was not completed, so other workers can claim it.
+        :param task: identifier of the task
+        """
+        with self.lock():
+            self.remove_claim(task)
+
+    def remove_claim(self, task):
+        """
+        Removes the claim of a task if it is held by this worker, and not taken over after its lease expired.
+        :param task: identifier of the task
+        """
+        claim_path = self.get_claim_path(task)
+        try:
+            with open(claim_path) as file:
+                worker_id = json.load(file)['worker']
+        except (FileNotFoundError, ValueError):
+            return
+        if worker_id == self.worker_id:
+            os.remove(claim_path)
+
+    def get_progress(self):
+        """
+        :return: Dict: number of completed, claimed and waiting tasks
+        """
+        completed = sum(self.is_completed(task) for task in self.tasks)
+        claimed = sum(not self.is_completed(task) and os.path.exists(self.get_claim_path(task)) for task in self.tasks)
+        return {'completed': completed, 'claimed': claimed, 'waiting': len(self.tasks) - completed - claimed}
+
+
+def write_json(path, content):
+    """
+    Writes a JSON file through a temporary file, so it is either complete or missing.
+    :param path: string: path of the file
+    :param content: Dict: JSON values
+    """
+    descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(descriptor, 'w') as file:
+        json.dump(content, file)
+    os.replace(temporary_path, path)
+
@@ -15,6 +15,17 @@ from experiments.experiment import *
 
 warnings.filterwarnings("ignore")
 
+# Columns kept by extract_important_results
+IMPORTANT_COLUMNS = ['step', 'date', 'X1', 'X2', 'X3', 'L1', 'L2', 'L3', 'experiment_setup', 'scenario_description',
+                     'policy_description', 'scenario', 'policy', 'M1_total', 'M1_total_residential',
+                     'M1_mean_residential', 'M1_total_non_residential', 'M2_total', 'M2_total_residential',
+                     'M2_mean_residential', 'M2_total_non_residential', 'M3_total', 'M3_total_residential',
+                     'M3_mean_residential', 'M3_total_non_residential', 'M4_total', 'M5_total', 'M5_total_residential',
+                     'M5_mean_residential', 'M5_total_non_residential', 'M6_total', 'M6_total_residential',
+                     'M6_mean_residential', 'M6_total_non_residential']
+# Value of every member in the string representation of a dictionary
+VALUE_PATTERN = re.compile(r":\s*([^,}]+)")
+
 
 def extract_from_json(item):
     """
@@ -37,11 +48,20 @@ def create_results_df(results):
     @param results: Dict
     @return df: DataFrame
     """
-    d = {}
-    for key in tqdm(results.keys()):
-        d = d | results[key].to_dict(orient='index')
     print(f"Creating dataframe...")
-    df = pd.DataFrame.from_dict(d, orient='index')
+    return combine_results(results)
+
+
+def combine_results(results):
+    """
+    Concatenates the results of all experiment setups in one step. Rows keep their index if the indices of all setups
+    are distinct, as assigned by add_experiment_setup_details, and are numbered in order of the setups otherwise.
+    @param results: Dict: DataFrame of every experiment setup
+    @return: DataFrame: results of all experiment setups
+    """
+    df = pd.concat(list(results.values()))
+    if not df.index.is_unique:
+        df.index = np.arange(len(df))
     return df
 
 
@@ -52,17 +72,8 @@ def extract_df_from_json(results, column='savings'):
     :param column: Name of column for extracting the DataFrame
     :return: DataFrame with agents and value of matrix for each timestep
     """
-    df = pd.DataFrame()
-    for index, row in results.iterrows():
-        try:
-            json.loads(row[column])
-        except ValueError:
-            item = row[column]
-            item = ast.literal_eval(re.search('({.+})', item).group(0))
-        else:
-            item = json.loads(row[column])
-
-        df = df.append(item, ignore_index=True)
+    values, members = decode_metric_column(results[column])
+    df = pd.DataFrame(values, columns=members)
     df = df[1:]
     df['date'] = results['date']
     return df
@@ -74,45 +85,71 @@ def calculate_key_matrices(df):
         @param df: DataFrame
         @return result_matrices: Dict
     """
+    print(f"calculating total, total_residential, mean_residential , total_non_residential value for "
+          f"{MEMBER_METRICS}...")
+    key_metrics = compute_key_metrics(df)
+    columns = [f"{metric[:2]}_{value}" for metric in MEMBER_METRICS for value in
+               ['total', 'total_residential', 'mean_residential', 'total_non_residential']]
+    return key_metrics[columns].to_dict(orient='index')
+
+
+def decode_metric_column(column):
+    """
+    Decodes a column of member values into a matrix. Rows are grouped by their layout of members, and the values of
+    every group are parsed in one pass over its joined cells instead of one json or literal parse per cell.
+    @param column: Series: dictionaries, or their json or string representation
+    @return: ndarray, list: (rows x members) values, nan for members missing in a row, and the names of the members
+    """
+    if isinstance(column.iloc[0], dict):
+        values = pd.DataFrame.from_records(column.to_list())
+        return values.to_numpy(dtype=float), values.columns.to_list()
+    column = column.astype(str).to_numpy()
+    # Layout of the members of every row, the cell without its values
+    rows, layouts = pd.factorize([VALUE_PATTERN.sub(':', cell) for cell in column])
+    members = {}
+    blocks = []
+    for layout in range(len(layouts)):
+        positions = np.flatnonzero(rows == layout)
+        keys = list(extract_from_json(column[positions[0]]).keys())
+        values = [np.nan if value in ['None', 'null'] else value for value in
+                  VALUE_PATTERN.findall(' '.join(column[positions]))]
+        blocks.append((positions, [members.setdefault(key, len(members)) for key in keys],
+                       np.array(values, dtype=float).reshape(len(positions), len(keys))))
+    matrix = np.full((len(column), len(members)), np.nan)
+    for positions, columns, values in blocks:
+        matrix[positions[:, None], columns] = values
+    return matrix, list(members.keys())
+
+
+def get_metric_matrix(results, metric):
+    """
+    Returns the values of a metric for every row and member.
+    @param results: DataFrame: results with a column of member values per metric, or (metric, member) columns of the
+    result store
+    @param metric: String: name of the metric
+    @return: ndarray, list: (rows x members) values and the names of the members
+    """
+    if isinstance(results.columns, pd.MultiIndex):
+        values = results[metric]
+        return values.to_numpy(dtype=float), values.columns.to_list()
+    return decode_metric_column(results[metric])
 
-    # create a list of matrix
-    matrices = ['M1: realised_demand', 'M2: scheduled_demand', 'M3: shifted_load',
-                'M5: savings_on_ToD', 'M6: energy_costs']
-    # create a dictionary of columns header and its index
-    columns_dict = {}
-    index = 1
-    columns = df.columns.to_list()
-
-    for header in columns:
-        columns_dict[header] = index
-        index += 1
-
-    # get list of residential and non-residential members
-    m = df.loc[0, 'M1: realised_demand']
-    m = extract_from_json(item=m)
-    members = list(m.keys())
-    check = 'hh'
-    residential = [idx for idx in members if idx.lower().startswith(check.lower())]
-    non_residential = list(set(members) - set(residential))
 
-    print(f"calculating total, total_residential, mean_residential , total_non_residential value for {matrices}...")
-    result_matrices = {}
-    # iterate over results dataframe
-    for row in tqdm(df.itertuples(), total=len(df)):
-        result_dict = {}
-        # iterate over performance matrix
-        for matrix in matrices:
-            m = extract_from_json(item=row[columns_dict[matrix]])
-            # calculate important values from the matrix
-            result_dict[f"{matrix[:2]}_total"] = sum(m.values())
-            result_dict[f"{matrix[:2]}_total_residential"] = sum({k: m[k] for k in m.keys() & residential}.values())
-            result_dict[f"{matrix[:2]}_mean_residential"] = sum(
-                {k: m[k] for k in m.keys() & residential}.values()) / len(residential)
-            result_dict[f"{matrix[:2]}_total_non_residential"] = sum(
-                {k: m[k] for k in m.keys() & non_residential}.values())
-        # set index for dictionary
-        result_matrices[row[0]] = result_dict
-    return result_matrices
+def compute_key_metrics(results):
+    """
+    Computes the total, residential and non-residential values of every metric for all rows at once. Every metric
+    column is decoded once into a (rows x members) matrix and reduced over the members of each group. Members missing
+    in a row are left out of its totals, means and standard deviations.
+    @param results: DataFrame: results of the model, with a column of member values per metric
+    @return: DataFrame: key metrics with the index of the results
+    """
+    key_metrics = {}
+    for metric in MEMBER_METRICS:
+        values, members = get_metric_matrix(results, metric)
+        key_metrics |= get_member_key_metrics(values, members, metric)
+    generation, asset_categories = get_metric_matrix(results, GENERATION_METRIC)
+    key_metrics["M4_total"] = generation[:, asset_categories.index(SOLAR_CATEGORY)]
+    return pd.DataFrame(key_metrics, index=results.index)
 
 
 def plot_community_consumption_and_generation(results):
@@ -347,10 +384,7 @@ def add_experiment_setup_details(results):
 
 def combine_dictionaries(results):
     """Combine results from different simulation runs into one dictionary"""
-    d = {}
-    for key in tqdm(results.keys()):
-        d = d | results[key].to_dict(orient='index')
-    return d
+    return combine_results(results).to_dict(orient='index')
 
 
 def get_members_list(d):
@@ -371,35 +405,21 @@ def get_members_list(d):
 
 def extract_important_results(d):
     """Extracts important results from the dictionary"""
-    columns = ['step', 'date', 'X1', 'X2', 'X3', 'L1', 'L2', 'L3', 'experiment_setup', 'scenario_description',
-               'policy_description', 'scenario', 'policy', 'M1_total', 'M1_total_residential', 'M1_mean_residential',
-               'M1_total_non_residential', 'M2_total', 'M2_total_residential', 'M2_mean_residential',
-               'M2_total_non_residential', 'M3_total', 'M3_total_residential', 'M3_mean_residential',
-               'M3_total_non_residential', 'M4_total', 'M5_total', 'M5_total_residential',
-               'M5_mean_residential', 'M5_total_non_residential', 'M6_total', 'M6_total_residential',
-               'M6_mean_residential', 'M6_total_non_residential']
-    # create list of residential and non-residential members
-    residential, non_residential, residential_types = get_members_list(d)
-    matrices = ['M1: realised_demand', 'M2: scheduled_demand', 'M3: shifted_load', 'M5: savings_on_ToD',
-                'M6: energy_costs']
-    for key in tqdm(d.keys()):
-        for matrix in matrices:
-            m = extract_from_json(d[key][matrix])
-            d[key][f"{matrix[:2]}_total"] = sum(m.values())
-            d[key][f"{matrix[:2]}_total_residential"] = sum({k: m[k] for k in m.keys() & residential}.values())
-            d[key][f"{matrix[:2]}_mean_residential"] = sum(
-                {k: m[k] for k in m.keys() & residential}.values()) / len(residential)
-            d[key][f"{matrix[:2]}_std_residential"] = np.std(list({k: m[k] for k in m.keys() & residential}.values()))
-            d[key][f"{matrix[:2]}_total_non_residential"] = sum(
-                {k: m[k] for k in m.keys() & non_residential}.values())
-            for residential_type in residential_types.keys():
-                d[key][f"{matrix[:2]}_mean_{residential_type}"] = sum(
-                    {k: m[k] for k in m.keys() & residential_types[residential_type]}.values()) / len(
-                    residential_types[residential_type])
-        d[key]["M4_total"] = extract_from_json(d[key]['M4: total_generation'])["<class 'model.agents.Solar'>"]
-        d[key] = {k: d[key][k] for k in d[key].keys() & columns}
-
-    return d
+    results = pd.DataFrame.from_dict(d, orient='index')
+    return get_important_results(results).to_dict(orient='index')
+
+
+def get_important_results(results):
+    """
+    Returns the experiment details and key metrics of every row of the results
+    @param results: DataFrame: results with experiment setup details, or (metric, member) columns of the result store
+    @return: DataFrame: columns expected by aggregate_timeseries_data
+    """
+    key_metrics = compute_key_metrics(results)
+    if isinstance(results.columns, pd.MultiIndex):
+        results = results.loc[:, results.columns.get_level_values(1) == ''].droplevel(1, axis=1)
+    important_results = pd.concat([results, key_metrics], axis=1)
+    return important_results[[column for column in IMPORTANT_COLUMNS if column in important_results.columns]]
 
 
 def check_data_sanity(results):
@@ -416,26 +436,14 @@ def aggregate_timeseries_data(results):
     @param results: results dataframe
     @return: aggregated dataframe
     """
-    sum_c = ['M1_total_residential', 'M1_total_non_residential', 'M1_total',
-             'M2_total_residential', 'M2_total_non_residential', 'M2_total',
-             'M3_total_residential', 'M3_total_non_residential', 'M3_total',
-             'M4_total',
-             'M5_total_residential', 'M5_total_non_residential', 'M5_total',
-             'M6_total_residential', 'M6_total_non_residential', 'M6_total', ]
-    mean_c = ['M1_mean_residential',
-              'M2_mean_residential',
-              'M3_mean_residential',
-              'M5_mean_residential',
-              'M6_mean_residential', ]
-
     experiment_setups = results['experiment_setup'].unique()
     # Aggregate annual values
     results_dict = {}
     for experiment_setup in tqdm(experiment_setups):
         replications = results[results['experiment_setup'] == experiment_setup]
         mean_values = replications.groupby('date').mean()
-        sum_dict = mean_values[sum_c].sum().to_dict()
-        mean_dict = mean_values[mean_c].mean().to_dict()
+        sum_dict = mean_values[SUM_COLUMNS].sum().to_dict()
+        mean_dict = mean_values[MEAN_COLUMNS].mean().to_dict()
         results_dict[experiment_setup] = {**sum_dict, **mean_dict, 'experiment_setup': experiment_setup} | \
                                          mean_values.loc[
                                              '01-01-2021', ['X1', 'X2', 'X3', 'L1', 'L2', 'L3']].to_dict()